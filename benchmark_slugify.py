@@ -0,0 +1,68 @@
+"""
+Microbenchmark for the slugify functions.
+
+Compares the original regex-by-regex slugify with default_slugify() and
+fast_slugify() on a mix of place names, and checks they agree.
+
+Usage: python benchmark_slugify.py [repeat]
+"""
+
+import re
+import sys
+import timeit
+import unicodedata
+
+from django.conf import settings
+
+settings.configure()
+
+import cities.conf  # noqa: E402,F401  (must load before cities.util)
+from cities import util  # noqa: E402
+
+NAMES = [
+    "Kyiv",
+    "Andorra la Vella",
+    "Saint-Jean-d'Angély",
+    "São Paulo (undefined)",
+    "Ḩalab",
+    "Sankt Peterburg",
+    "Île-de-France",
+    "'Ajlūn",
+    "Kraków - Śródmieście",
+    "New York City",
+] * 1000
+
+
+def reference_slugify(value):
+    value = unicodedata.normalize("NFKC", str(value).strip())
+    value = re.sub(util.to_und_rgx, "_", value)
+    value = re.sub(util.slugify_rgx, "-", value)
+    value = re.sub(util.multi_dash_rgx, "-", value)
+    value = re.sub(util.dash_und_rgx, "_", value)
+    value = re.sub(util.und_dash_rgx, "_", value)
+    value = re.sub(util.starting_chars_rgx, "", value)
+    value = re.sub(util.ending_chars_rgx, "", value)
+    return value
+
+
+def main():
+    try:
+        repeat = int(sys.argv[1])
+    except IndexError:
+        repeat = 10
+
+    for name in set(NAMES):
+        assert util.fast_slugify(None, name) == reference_slugify(name), name
+
+    candidates = [
+        ("reference", lambda: [reference_slugify(name) for name in NAMES]),
+        ("default_slugify", lambda: [util.default_slugify(None, name) for name in NAMES]),
+        ("fast_slugify", lambda: [util.fast_slugify(None, name) for name in NAMES]),
+    ]
+    for label, func in candidates:
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        print("{:<16} {:8.2f} us/name".format(label, best / len(NAMES) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,7 @@ __all__ = [
     "INCLUDE_NUMERIC_ALTERNATIVE_NAMES",
     "NO_LONGER_EXISTENT_COUNTRY_CODES",
     "SKIP_CITIES_WITH_EMPTY_REGIONS",
+    "SLUGIFY_CACHE_SIZE",
     "SLUGIFY_FUNCTION",
     "VALIDATE_POSTAL_CODES",
     "URL_BASES",
@@ -169,6 +170,31 @@ files = {
     },
 }
 
+# GeoNames also publishes per-country extracts of its largest files. When
+# CITIES_COUNTRY_FILES lists country codes, these keys resolve to one
+# "{country}.zip" per country instead of the worldwide file. Each key gets its
+# own subdirectory of data_dir since the extracts share their filenames.
+country_files = {
+    "city": {
+        "subdir": "dump",
+        "urls": [
+            url_bases["geonames"]["dump"] + "{filename}",
+        ],
+    },
+    "alt_name": {
+        "subdir": "alternatenames",
+        "urls": [
+            url_bases["geonames"]["dump"] + "alternatenames/{filename}",
+        ],
+    },
+    "postal_code": {
+        "subdir": "zip",
+        "urls": [
+            url_bases["geonames"]["zip"] + "{filename}",
+        ],
+    },
+}
+
 country_codes = [
     "AD",
     "AE",
@@ -608,6 +634,11 @@ _NO_LONGER_EXISTENT_COUNTRY_CODES = ["CS", "AN"]
 
 _SLUGIFY_FUNCTION = getattr(django_settings, "CITIES_SLUGIFY_FUNCTION", "cities.util.default_slugify")
 
+# Number of slugified values the default slugify function remembers (default:
+# 0, no cache). Only worth enabling when many objects slugify the same value,
+# e.g. with custom slugify() methods that leave out the id
+SLUGIFY_CACHE_SIZE = getattr(django_settings, "CITIES_SLUGIFY_CACHE_SIZE", 0)
+
 # See http://www.geonames.org/export/codes.html
 city_types = ["PPL", "PPLA", "PPLC", "PPLA2", "PPLA3", "PPLA4", "PPLG"]
 district_types = ["PPLX"]
@@ -635,6 +666,18 @@ import_opts_all = [
 ]
 
 
+# Lookup from each data type's model to its ISO country code, used to scope
+# imports and flushes to the countries given with --countries
+country_lookups = {
+    "country": "code",
+    "region": "country__code",
+    "subregion": "region__country__code",
+    "city": "country__code",
+    "district": "city__country__code",
+    "postal_code": "country__code",
+}
+
+
 # Raise inside a hook (with an error message) to skip the current line of data.
 class HookException(Exception):
     pass
@@ -696,6 +739,19 @@ def create_settings():
     if hasattr(django_settings, "CITIES_DATA_DIR"):
         res.data_dir = django_settings.CITIES_DATA_DIR
 
+    # Persist built indices in data_dir and reuse them while their source
+    # tables and files are unchanged (default: False)
+    res.index_cache = getattr(django_settings, "CITIES_INDEX_CACHE", False)
+
+    # Approximate memory budget in bytes for each import index; indices that
+    # would exceed it are built in an SQLite file in data_dir (default: None,
+    # no limit)
+    res.index_memory_limit = getattr(django_settings, "CITIES_INDEX_MEMORY_LIMIT", None)
+
+    # Split alternate names files into per-language segment files in data_dir
+    # once, and read only the segments of the configured locales (default: False)
+    res.alt_name_segments = getattr(django_settings, "CITIES_ALT_NAME_SEGMENTS", False)
+
     # File download timeout in seconds (default: 30)
     if hasattr(django_settings, "CITIES_FILE_DOWNLOAD_TIMEOUT"):
         res.file_download_timeout = django_settings.CITIES_FILE_DOWNLOAD_TIMEOUT
@@ -714,6 +770,28 @@ def create_settings():
     else:
         res.postal_codes = set(["ALL"])
 
+    # Resolve the larger files to GeoNames' per-country extracts, unless the
+    # user has pointed that file key somewhere else with CITIES_FILES
+    if getattr(django_settings, "CITIES_COUNTRY_FILES", None):
+        res.country_files = set([e.upper() for e in django_settings.CITIES_COUNTRY_FILES])
+        user_files = getattr(django_settings, "CITIES_FILES", {})
+        for key, country_file in country_files.items():
+            if key in user_files:
+                continue
+            if key == "postal_code" and "ALL" not in res.postal_codes:
+                # Only the configured postal code countries get imported anyway
+                countries = res.postal_codes
+            else:
+                countries = res.country_files
+            res.files[key] = {
+                "filenames": ["{}.zip".format(code) for code in sorted(countries)],
+                "subdir": country_file["subdir"],
+                "urls": country_file["urls"],
+                "fields": files[key]["fields"],
+            }
+    else:
+        res.country_files = set()
+
     return res()
 
 
@@ -1,5 +1,6 @@
 """Alternative name importer"""
 
+from django.db import transaction
 from swapper import load_model
 
 from ..conf import INCLUDE_AIRPORT_CODES, INCLUDE_NUMERIC_ALTERNATIVE_NAMES, settings
@@ -8,10 +9,14 @@ from .base import BaseImporter
 
 City = load_model("cities", "City")
 
+ALT_NAME_BATCH_SIZE = 1000  # Alternative names written per bulk create/update
+
 
 class AlternativeNameImporter(BaseImporter):
     """Imports alternative name data from GeoNames"""
 
+    batch_size = ALT_NAME_BATCH_SIZE
+
     def get_file_key(self):
         return "alt_name"
 
@@ -22,8 +27,32 @@ class AlternativeNameImporter(BaseImporter):
         return "Importing data for alternative names"
 
     def build_indices(self):
-        """Build comprehensive geo index"""
-        self.geo_index = self.index_builder.build_geo_index(self.options.get("quiet"))
+        """Build geo id index"""
+        # Alternative names carry no country code; restricting the geo index
+        # to the imported countries skips names of places elsewhere
+        self.geo_index = self.index_builder.build_geo_id_index(self.options.get("quiet"), countries=self.countries)
+
+    def load_data(self, rows=None):
+        """
+        Load the alternative names in the configured locales
+
+        Rows in other languages are skipped before they are decoded, and with
+        CITIES_ALT_NAME_SEGMENTS only the configured languages' segments of
+        the file are read at all.
+        """
+        if rows is not None or "all" in settings.locales:
+            return super().load_data(rows)
+
+        # Names without a language are imported as "und"
+        languages = set(settings.locales)
+        if "und" in languages:
+            languages.add("")
+
+        if settings.alt_name_segments:
+            rows = self.parser.get_segmented_data(self.get_file_key(), "language", languages)
+        else:
+            rows = self.parser.get_data(self.get_file_key(), field="language", values=languages)
+        return [item for item in rows if self.wants_item(item)]
 
     def parse_item(self, item):
         """Parse alternative name data"""
@@ -46,7 +75,7 @@ class AlternativeNameImporter(BaseImporter):
         geo_id = self.validator.parse_int(item.get("geonameid"), "geonameid", entity_type="AlternativeName")
 
         try:
-            geo_info = self.geo_index[geo_id]
+            geo_type = self.geo_index[geo_id]
         except KeyError:
             # Unknown geonameid, skip
             return None
@@ -64,16 +93,16 @@ class AlternativeNameImporter(BaseImporter):
 
         if is_numeric and not INCLUDE_NUMERIC_ALTERNATIVE_NAMES:
             self.logger.debug(
-                "Trying to add a numeric alternative name to %s (%s): %s -- skipping",
-                geo_info["object"].name,
-                geo_info["type"].__name__,
+                "Trying to add a numeric alternative name to %d (%s): %s -- skipping",
+                geo_id,
+                geo_type.__name__,
                 name,
             )
             return None
 
         # Handle special "post" locale - creates postal codes instead of alt names
         if locale == "post":
-            self._create_postal_code_from_alt_name(geo_info, name)
+            self._create_postal_code_from_alt_name(geo_type, geo_id, name)
             return None
 
         return {
@@ -83,7 +112,8 @@ class AlternativeNameImporter(BaseImporter):
             "is_preferred": self.validator.parse_bool(item.get("isPreferred", "")),
             "is_short": self.validator.parse_bool(item.get("isShort", "")),
             "is_historic": self._parse_historic(item.get("isHistoric", ""), locale),
-            "geo_info": geo_info,
+            "geo_type": geo_type,
+            "geo_id": geo_id,
             "item": item,  # Keep original for hooks
         }
 
@@ -95,11 +125,24 @@ class AlternativeNameImporter(BaseImporter):
             return True
         return False
 
-    def _create_postal_code_from_alt_name(self, geo_info, name):
+    def _load_geo_object(self, geo_type, geo_id):
+        """Load a place with the relations postal code creation reads"""
+        qs = geo_type.objects.all()
+        if geo_type == Region:
+            qs = qs.select_related("country")
+        elif geo_type == Subregion:
+            qs = qs.select_related("region__country")
+        elif geo_type == City:
+            qs = qs.select_related("country", "region", "subregion")
+        return qs.get(id=geo_id)
+
+    def _create_postal_code_from_alt_name(self, geo_type, geo_id, name):
         """Create postal code from alternative name with locale='post'"""
+        if geo_type not in (Region, Subregion, City):
+            return
+
         try:
-            geo_type = geo_info["type"]
-            geo_obj = geo_info["object"]
+            geo_obj = self._load_geo_object(geo_type, geo_id)
 
             if geo_type == Region:
                 PostalCode.objects.get_or_create(
@@ -128,32 +171,22 @@ class AlternativeNameImporter(BaseImporter):
                     region_name=region_name,
                     subregion_name=subregion_name,
                 )
-        except KeyError:
+        except (KeyError, geo_type.DoesNotExist):
             pass
 
-    def create_or_update(self, parsed_data):
-        """Create or update alternative name record"""
-        alt_id = parsed_data["alt_id"]
-        name = parsed_data["name"]
-        locale = parsed_data["locale"]
-        is_preferred = parsed_data["is_preferred"]
-        is_short = parsed_data["is_short"]
-        is_historic = parsed_data["is_historic"]
-        geo_info = parsed_data["geo_info"]
+    def _set_fields(self, alt, parsed_data):
+        """
+        Copy parsed data onto an alternative name
 
-        # Get or create alternative name
-        try:
-            alt = AlternativeName.objects.get(id=alt_id)
-            created = False
-        except AlternativeName.DoesNotExist:
-            alt = AlternativeName(id=alt_id)
-            created = True
+        Returns:
+            bool: False if the name is of an unknown kind and must be skipped
+        """
+        locale = parsed_data["locale"]
 
-        # Set fields
-        alt.name = name
-        alt.is_preferred = is_preferred
-        alt.is_short = is_short
-        alt.is_historic = is_historic
+        alt.name = parsed_data["name"]
+        alt.is_preferred = parsed_data["is_preferred"]
+        alt.is_short = parsed_data["is_short"]
+        alt.is_historic = parsed_data["is_historic"]
 
         # Set language_code or language (depending on model)
         try:
@@ -167,14 +200,99 @@ class AlternativeNameImporter(BaseImporter):
                 alt.kind = locale
             elif locale not in settings.locales and "all" not in settings.locales:
                 self.logger.debug("Unknown alternative name type: %s -- skipping", locale)
-                return None, False
+                return False
+
+        return True
+
+    def create_or_update(self, parsed_data):
+        """Create or update alternative name record"""
+        alt_id = parsed_data["alt_id"]
+        geo_type = parsed_data["geo_type"]
+        geo_id = parsed_data["geo_id"]
 
-        # Save and link to geographic object
-        alt.save()
-        geo_info["object"].alt_names.add(alt)
+        # Get or create alternative name. The default manager hides links,
+        # which are updated in place like any other existing row
+        try:
+            alt = AlternativeName._base_manager.get(id=alt_id)
+            created = False
+        except AlternativeName.DoesNotExist:
+            alt = AlternativeName(id=alt_id)
+            created = True
+
+        if not self._set_fields(alt, parsed_data):
+            return None, False
+
+        # Save and link to geographic object, which only needs its id. The id
+        # is the geonameid, so the slug is known before the first write, and
+        # a new row is inserted without first trying an UPDATE
+        alt.save(force_insert=created)
+        geo_type(id=geo_id).alt_names.add(alt)
 
         return alt, created
 
+    def create_or_update_batch(self, parsed_batch):
+        """
+        Create or update a batch of alternative names with bulk queries
+
+        Follows the same rules as create_or_update(). Existing names (links
+        included) are loaded in one query, the batch is written with one
+        bulk_update() and one bulk_create(), and the links to places are
+        inserted straight into each place type's through table, skipping
+        links that already exist. m2m_changed is not sent for these links.
+        """
+        by_id = AlternativeName._base_manager.in_bulk(set(parsed["alt_id"] for parsed in parsed_batch))
+
+        to_create = {}
+        to_update = {}
+        # {place type: {(place id, alternative name id)}}
+        links = {}
+        results = []
+
+        for parsed in parsed_batch:
+            alt = by_id.get(parsed["alt_id"])
+            created = alt is None
+            if created:
+                alt = AlternativeName(id=parsed["alt_id"])
+
+            if not self._set_fields(alt, parsed):
+                results.append((None, False))
+                continue
+
+            if created:
+                to_create[alt.id] = alt
+                by_id[alt.id] = alt
+            elif alt.id not in to_create:
+                to_update[alt.id] = alt
+
+            # What save() would have done before writing
+            alt.set_slug()
+
+            links.setdefault(parsed["geo_type"], set()).add((parsed["geo_id"], alt.id))
+            results.append((alt, created))
+
+        update_fields = ["name", "is_preferred", "is_short", "is_historic", "slug"]
+        for field in ("language_code", "language", "kind"):
+            if hasattr(AlternativeName, field):
+                update_fields.append(field)
+
+        with transaction.atomic():
+            if to_update:
+                AlternativeName._base_manager.bulk_update(list(to_update.values()), update_fields)
+            if to_create:
+                AlternativeName._base_manager.bulk_create(list(to_create.values()))
+
+            for geo_type, pairs in links.items():
+                field = geo_type._meta.get_field("alt_names")
+                through = field.remote_field.through
+                place_column = through._meta.get_field(field.m2m_field_name()).attname
+                alt_column = through._meta.get_field(field.m2m_reverse_field_name()).attname
+                through.objects.bulk_create(
+                    [through(**{place_column: geo_id, alt_column: alt_id}) for geo_id, alt_id in pairs],
+                    ignore_conflicts=True,
+                )
+
+        return results
+
     def log_result(self, obj, created):
         """Log import result"""
         locale = obj.language_code if hasattr(obj, "language_code") else obj.language
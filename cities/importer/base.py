@@ -23,8 +23,20 @@ class BaseImporter(ABC):
     3. Build indices
     4. Import records with hooks and error handling
     5. Cleanup
+
+    Importers that set batch_size write records through
+    create_or_update_batch(), batch_size rows at a time.
+
+    Importers that set feature_codes only keep rows of those feature codes
+    when reading their file.
     """
 
+    # Rows per create_or_update_batch() call; None imports row by row
+    batch_size = None
+
+    # GeoNames feature codes of the rows to import; None keeps every row
+    feature_codes = None
+
     def __init__(self, command, options):
         """
         Initialize importer
@@ -37,6 +49,9 @@ class BaseImporter(ABC):
         self.options = options
         self.logger = logging.getLogger(LOGGER_NAME)
 
+        # Country codes to restrict the import to (empty means all countries)
+        self.countries = set(options.get("countries") or [])
+
         # Initialize services
         self.downloader = Downloader(command.data_dir, force=options.get("force", False))
         self.parser = Parser(command.data_dir)
@@ -52,24 +67,33 @@ class BaseImporter(ABC):
         self.postal_code_regex_index = None
         self.continent_index = None
 
-    def run(self):
+    def run(self, rows=None):
         """
         Main entry point - template method defining import workflow
+
+        Args:
+            rows: Optional rows of the importer's file, already read by the
+                caller (e.g. when several importers share the file); the file
+                is then neither downloaded nor read again
         """
         # 1. Download files
-        self.download_files()
+        self.download_files(data_file=rows is None)
 
         # 2. Load and parse data
-        data = self.load_data()
+        data = self.load_data(rows)
 
-        # 3. Build required indices
-        self.build_indices()
+        try:
+            # 3. Build required indices
+            self.build_indices()
 
-        # 4. Import records
-        self.import_records(data)
+            # 4. Import records
+            self.import_records(data)
 
-        # 5. Cleanup
-        self.cleanup()
+            # 5. Cleanup
+            self.cleanup()
+        finally:
+            # Remove indices that spilled to disk
+            self.index_builder.close()
 
     @abstractmethod
     def get_file_key(self):
@@ -120,6 +144,74 @@ class BaseImporter(ABC):
         """
         pass
 
+    def create_or_update_batch(self, parsed_batch):
+        """
+        Create or update a batch of database records
+
+        Called instead of create_or_update() when batch_size is set. Override
+        to write the batch with bulk queries; this default writes the records
+        one by one. If it raises, the batch is retried row by row with
+        create_or_update().
+
+        Args:
+            parsed_batch: List of parsed data dicts from parse_item()
+
+        Returns:
+            list: (object, created) tuples, in the order of parsed_batch
+        """
+        return [self.create_or_update(parsed) for parsed in parsed_batch]
+
+    def get_country_code(self, item):
+        """
+        Return the country code of a raw item
+
+        Override in subclasses whose files carry a country code so that
+        --countries can filter rows before they are parsed.
+
+        Args:
+            item: Raw data dict from parser
+
+        Returns:
+            str: Country code, or None if the item has none
+        """
+        return None
+
+    def include_item(self, item):
+        """
+        Check whether a raw item belongs to the countries being imported
+
+        Args:
+            item: Raw data dict from parser
+
+        Returns:
+            bool: True if the item should be imported
+        """
+        if not self.countries:
+            return True
+        country_code = self.get_country_code(item)
+        return country_code is None or country_code in self.countries
+
+    def accepts_item(self, item):
+        """
+        Check whether a raw item is of a feature code this importer imports
+
+        While pre-hooks are installed every item is accepted, since a hook
+        may still change the item's feature code.
+
+        Args:
+            item: Raw data dict from parser
+
+        Returns:
+            bool: True if the item should be kept
+        """
+        if self.feature_codes is None or item.get("featureCode") in self.feature_codes:
+            return True
+        return bool(getattr(settings, "plugins", {}).get(f"{self.get_hook_prefix()}_pre"))
+
+    def wants_item(self, item):
+        """Check whether a raw item is kept when the importer's file is read"""
+        return self.include_item(item) and self.accepts_item(item)
+
     def get_description(self):
         """
         Get description for progress bar
@@ -138,18 +230,30 @@ class BaseImporter(ABC):
         """
         return self.get_model_class()._meta.model_name
 
-    def download_files(self):
-        """Download required files"""
-        self.downloader.download(self.get_file_key())
+    def download_files(self, data_file=True):
+        """
+        Download required files
 
-    def load_data(self):
+        Args:
+            data_file: Whether to download the file of get_file_key(); False
+                when its rows were read by the caller
+        """
+        if data_file:
+            self.downloader.download(self.get_file_key())
+
+    def load_data(self, rows=None):
         """
         Load and parse data file
 
+        Args:
+            rows: Optional rows of the file already read by the caller
+
         Returns:
             list: List of parsed data dicts
         """
-        return list(self.parser.get_data(self.get_file_key()))
+        if rows is None:
+            rows = self.parser.get_data(self.get_file_key())
+        return [item for item in rows if self.wants_item(item)]
 
     def build_indices(self):
         """
@@ -164,10 +268,14 @@ class BaseImporter(ABC):
         """
         Main import loop with hooks and error handling
 
+        With batch_size set, parsed rows are buffered and written in batches;
+        post-hooks then run once their row's batch has been written.
+
         Args:
             data: List of parsed data dicts
         """
         total = len(data)
+        batch = []
 
         for item in tqdm(
             data,
@@ -185,6 +293,13 @@ class BaseImporter(ABC):
                 if parsed is None:
                     continue
 
+                if self.batch_size:
+                    batch.append((parsed, item))
+                    if len(batch) >= self.batch_size:
+                        self._import_batch(batch)
+                        batch = []
+                    continue
+
                 # Create/update
                 obj, created = self.create_or_update(parsed)
 
@@ -203,6 +318,44 @@ class BaseImporter(ABC):
                 self.logger.error("Error processing item: %s", e, exc_info=True)
                 continue
 
+        if batch:
+            self._import_batch(batch)
+
+    def _import_batch(self, batch):
+        """
+        Write a batch of parsed rows, then run their post-hooks
+
+        Args:
+            batch: List of (parsed, item) tuples
+        """
+        try:
+            results = self.create_or_update_batch([parsed for parsed, item in batch])
+        except Exception as e:
+            self.logger.warning("Batch write failed (%s), retrying %d rows one by one", e, len(batch))
+            results = None
+
+        for position, (parsed, item) in enumerate(batch):
+            try:
+                if results is None:
+                    obj, created = self.create_or_update(parsed)
+                else:
+                    obj, created = results[position]
+
+                # Post-hook
+                if not self.call_hook("post", obj, item):
+                    continue
+
+                # Log
+                self.log_result(obj, created)
+
+            except ValidationError as e:
+                self.logger.warning("%s", e)
+                continue
+
+            except Exception as e:
+                self.logger.error("Error processing item: %s", e, exc_info=True)
+                continue
+
     def call_hook(self, hook_type, *args, **kwargs):
         """
         Call plugin hooks
@@ -1,12 +1,9 @@
 """City importer"""
 
-from django.db import transaction
-from django.db.models import Q
 from swapper import load_model
 
 from ..conf import city_types
 from ..exceptions import ValidationError
-from ..models import Subregion
 from .base import BaseImporter
 
 City = load_model("cities", "City")
@@ -15,6 +12,8 @@ City = load_model("cities", "City")
 class CityImporter(BaseImporter):
     """Imports city data from GeoNames"""
 
+    feature_codes = set(city_types)
+
     def get_file_key(self):
         return "city"
 
@@ -24,10 +23,14 @@ class CityImporter(BaseImporter):
     def get_description(self):
         return "Importing cities"
 
+    def get_country_code(self, item):
+        return item.get("countryCode")
+
     def build_indices(self):
-        """Build country and region indices"""
+        """Build country, region id and subregion name indices"""
         self.country_index = self.index_builder.build_country_index(self.options.get("quiet"))
-        self.region_index = self.index_builder.build_region_index(self.options.get("quiet"))
+        self.region_index = self.index_builder.build_region_id_index(self.options.get("quiet"))
+        self.subregion_name_index = self.index_builder.build_subregion_name_index(self.options.get("quiet"))
 
     def parse_item(self, item):
         """Parse city data"""
@@ -69,7 +72,7 @@ class CityImporter(BaseImporter):
         region_code = item.get("admin1Code", "")
         region_key = country_code + "." + region_code
         try:
-            defaults["region"] = self.validator.lookup_foreign_key(
+            defaults["region_id"] = self.validator.lookup_foreign_key(
                 self.region_index, region_key, "Region", entity_type="City"
             )
         except ValidationError:
@@ -89,17 +92,17 @@ class CityImporter(BaseImporter):
                 )
                 return None  # Skip this city
             else:
-                defaults["region"] = None
+                defaults["region_id"] = None
 
         # Look up subregion (with fallback queries)
         subregion_code = item.get("admin2Code")
-        defaults["subregion"] = self._lookup_subregion(
-            country_code, region_code, subregion_code, defaults.get("region"), item["name"]
+        defaults["subregion_id"] = self._lookup_subregion(
+            country_code, region_code, subregion_code, defaults.get("region_id"), item["name"]
         )
 
         return {"id": city_id, "defaults": defaults}
 
-    def _lookup_subregion(self, country_code, region_code, subregion_code, region, city_name):
+    def _lookup_subregion(self, country_code, region_code, subregion_code, region_id, city_name):
         """
         Look up subregion with fallback logic
 
@@ -107,11 +110,14 @@ class CityImporter(BaseImporter):
             country_code: Country code
             region_code: Region code
             subregion_code: Subregion code
-            region: Region object
+            region_id: Region id
             city_name: City name (for logging)
 
         Returns:
-            Subregion object or None
+            Subregion id or None
+
+        Raises:
+            ValidationError: If the name matches several subregions of the region
         """
         if not subregion_code:
             return None
@@ -123,26 +129,20 @@ class CityImporter(BaseImporter):
         except KeyError:
             pass
 
-        # Fallback: Try database lookup by name
-        if region:
-            try:
-                with transaction.atomic():
-                    return Subregion.objects.get(
-                        Q(name=subregion_code) | Q(name=subregion_code.replace(" (undefined)", "")),
-                        region=region,
-                    )
-            except Subregion.DoesNotExist:
-                pass
-
-            # Fallback: Try database lookup by name_std
-            try:
-                with transaction.atomic():
-                    return Subregion.objects.get(
-                        Q(name_std=subregion_code) | Q(name_std=subregion_code.replace(" (undefined)", "")),
-                        region=region,
+        # Fallback: Try the subregions of the region by name, then by name_std
+        if region_id:
+            names = {subregion_code, subregion_code.replace(" (undefined)", "")}
+            for field in ("name", "name_std"):
+                index = self.subregion_name_index[field]
+                subregion_ids = set()
+                for name in names:
+                    subregion_ids.update(index.get((region_id, name), ()))
+                if len(subregion_ids) == 1:
+                    return subregion_ids.pop()
+                if subregion_ids:
+                    raise ValidationError(
+                        f"City: {city_name}: Subregion '{subregion_code}' matches several subregions by {field}"
                     )
-            except Subregion.DoesNotExist:
-                pass
 
         # Not found
         if subregion_code:
@@ -28,6 +28,9 @@ class CountryImporter(BaseImporter):
     def get_description(self):
         return "Importing countries"
 
+    def get_country_code(self, item):
+        return item.get("code")
+
     def build_indices(self):
         """Build continent index"""
         self.continent_index = self.index_builder.build_continent_index(self.options.get("quiet"))
@@ -35,9 +38,9 @@ class CountryImporter(BaseImporter):
         # Check if continent is a ForeignKey or CharField
         self.import_continents_as_fks = type(Country._meta.get_field("continent")) is ForeignKey
 
-    def load_data(self):
+    def load_data(self, rows=None):
         """Load country data, filtering out obsolete country codes"""
-        all_data = list(self.parser.get_data(self.get_file_key()))
+        all_data = super().load_data(rows)
         # Filter out NO_LONGER_EXISTENT_COUNTRY_CODES
         return [d for d in all_data if d["code"] not in NO_LONGER_EXISTENT_COUNTRY_CODES]
 
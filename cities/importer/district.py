@@ -1,33 +1,30 @@
 """District importer"""
 
-from django.contrib.gis.gdal.envelope import Envelope
-from django.contrib.gis.measure import D
 from django.db import transaction
-from swapper import load_model
 
 from ..conf import district_types
 from ..exceptions import ValidationError
 from ..models import District
-from ..util import geo_distance
+from ..util import DeferredPoint
 from .base import BaseImporter
 
-try:
-    from django.contrib.gis.db.models.functions import Distance
-except ImportError:
-    Distance = None
-
-City = load_model("cities", "City")
-
 # District city search constants
 # These could be made configurable via settings if needed
-DISTRICT_CITY_MIN_POPULATION = 100000  # Minimum city population for nearest city search
-DISTRICT_DISTANCE_SEARCH_KM = 1000  # Search radius in kilometers for distance queries
-DISTRICT_FALLBACK_SEARCH_DEGREES = 2  # Search radius in degrees for fallback non-distance queries
+DISTRICT_CITY_MIN_POPULATION = None  # Optional minimum city population for nearest city search
+DISTRICT_DISTANCE_SEARCH_KM = 1000  # Search radius in kilometers for nearest city search
+DISTRICT_BATCH_SIZE = 500  # Districts written per bulk create/update
+# Hierarchy types linking a district to its city; 'ADM' rows only link
+# administrative divisions, whose parents are never cities
+DISTRICT_HIERARCHY_TYPES = ("",)
 
 
 class DistrictImporter(BaseImporter):
     """Imports district data from GeoNames"""
 
+    batch_size = DISTRICT_BATCH_SIZE
+
+    feature_codes = set(district_types)
+
     def get_file_key(self):
         return "city"
 
@@ -37,17 +34,35 @@ class DistrictImporter(BaseImporter):
     def get_description(self):
         return "Importing districts"
 
-    def download_files(self):
+    def get_country_code(self, item):
+        return item.get("countryCode")
+
+    def download_files(self, data_file=True):
         """Download city and hierarchy files"""
-        super().download_files()  # Downloads city file
+        super().download_files(data_file)  # Downloads city file
         self.downloader.download("hierarchy")  # Also need hierarchy file for index
 
+    def load_data(self, rows=None):
+        """Load city file data, noting the ids of district rows"""
+        data = super().load_data(rows)
+        ids = self.validator.parse_int_column(
+            [item.get("geonameid") for item in data if item.get("featureCode") in district_types],
+            "geonameid",
+            entity_type="District",
+        )
+        self.district_ids = set(
+            int(district_id) for district_id, rejected in zip(ids.values, ids.rejected) if not rejected
+        )
+        return data
+
     def build_indices(self):
-        """Build required indices"""
-        self.country_index = self.index_builder.build_country_index(self.options.get("quiet"))
-        self.region_index = self.index_builder.build_region_index(self.options.get("quiet"))
-        self.hierarchy_index = self.index_builder.build_hierarchy_index()
-        self.city_index = self.index_builder.build_city_index(self.options.get("quiet"))
+        """Build hierarchy (for district rows only) and city id indices"""
+        self.hierarchy_index = self.index_builder.build_hierarchy_index(
+            types=DISTRICT_HIERARCHY_TYPES, children=self.district_ids
+        )
+        self.city_index = self.index_builder.build_city_id_index(self.options.get("quiet"))
+        # Built on the first district missing from the hierarchy
+        self.city_location_index = None
 
     def parse_item(self, item):
         """Parse district data"""
@@ -58,13 +73,15 @@ class DistrictImporter(BaseImporter):
         # Validate geonameid
         geonameid = self.validator.parse_int(item.get("geonameid"), "geonameid", entity_type="District")
 
-        # Parse location
-        location = self.validator.parse_location(item.get("latitude"), item.get("longitude"), entity_type="District")
+        # Parse location, keeping the coordinates for the nearest city search
+        coordinates = self.validator.parse_coordinates(
+            item.get("latitude"), item.get("longitude"), entity_type="District"
+        )
 
         defaults = {
             "name": item["name"],
             "name_std": item.get("asciiName", ""),
-            "location": location,
+            "location": DeferredPoint(*coordinates),
             "population": self.validator.parse_int(item.get("population"), "population", default=0),
         }
 
@@ -73,84 +90,51 @@ class DistrictImporter(BaseImporter):
             defaults["code"] = item.get("admin3Code", "")
 
         # Find city
-        city = self._find_city(geonameid, defaults, item["name"])
-        if not city:
+        city_id = self._find_city(geonameid, coordinates, item["name"])
+        if not city_id:
             raise ValidationError(f"District: {defaults['name']}: Cannot find city -- skipping")
 
-        defaults["city"] = city
+        defaults["city_id"] = city_id
 
         return {"id": geonameid, "defaults": defaults}
 
-    def _find_city(self, geonameid, defaults, name):
+    def _find_city(self, geonameid, coordinates, name):
         """
         Find city for district
 
         Args:
             geonameid: District geoname ID
-            defaults: Dict with district data including location
+            coordinates: District (longitude, latitude)
             name: District name for logging
 
         Returns:
-            City object or None
+            City id or None
         """
         # Try hierarchy first
-        try:
-            city = self.city_index[self.hierarchy_index[geonameid]]
-            self.logger.debug("Found city in hierarchy: %s [%d]", city.name, geonameid)
-            return city
-        except KeyError:
-            self.logger.debug(
-                "District: %d %s: Cannot find city in hierarchy, using nearest",
-                geonameid,
-                name,
-            )
-
-        # Fallback: Find nearest city using distance query
-        # Try native distance query
-        if Distance:
-            try:
-                city = (
-                    City.objects.filter(
-                        location__distance_lte=(
-                            defaults["location"],
-                            D(km=DISTRICT_DISTANCE_SEARCH_KM),
-                        )
-                    )
-                    .annotate(distance=Distance("location", defaults["location"]))
-                    .order_by("distance")
-                    .first()
-                )
-                if city:
-                    return city
-            except Exception:
-                pass
-
-        # Fallback: Degree-based search for databases without distance support
-        self.logger.warning(
-            "District: %s: DB backend does not support native '.distance(...)' query "
-            "falling back to %d degree search",
+        city_id = self.hierarchy_index.get(geonameid)
+        if city_id is not None and city_id in self.city_index:
+            self.logger.debug("Found city in hierarchy: %d [%d]", city_id, geonameid)
+            return city_id
+
+        self.logger.debug(
+            "District: %d %s: Cannot find city in hierarchy, using nearest",
+            geonameid,
             name,
-            DISTRICT_FALLBACK_SEARCH_DEGREES,
-        )
-        min_dist = float("inf")
-        city = None
-
-        bounds = Envelope(
-            defaults["location"].x - DISTRICT_FALLBACK_SEARCH_DEGREES,
-            defaults["location"].y - DISTRICT_FALLBACK_SEARCH_DEGREES,
-            defaults["location"].x + DISTRICT_FALLBACK_SEARCH_DEGREES,
-            defaults["location"].y + DISTRICT_FALLBACK_SEARCH_DEGREES,
         )
 
-        for e in City.objects.filter(population__gt=DISTRICT_CITY_MIN_POPULATION).filter(
-            location__intersects=bounds.wkt
-        ):
-            dist = geo_distance(defaults["location"], e.location)
-            if dist < min_dist:
-                min_dist = dist
-                city = e
+        # Fallback: Find nearest city
+        if self.city_location_index is None:
+            self.city_location_index = self.index_builder.build_city_location_index(
+                self.options.get("quiet"), min_population=DISTRICT_CITY_MIN_POPULATION
+            )
 
-        return city
+        nearest = self.city_location_index.nearest(*coordinates, max_distance_km=DISTRICT_DISTANCE_SEARCH_KM)
+        if nearest is None:
+            return None
+
+        city_id, distance = nearest
+        self.logger.debug("Found nearest city: %d [%d] at %.1f km", city_id, geonameid, distance)
+        return city_id
 
     def create_or_update(self, parsed_data):
         """Create or update district record"""
@@ -160,7 +144,7 @@ class DistrictImporter(BaseImporter):
         # Check if district already exists (by city + name)
         try:
             with transaction.atomic():
-                district = District.objects.get(city=defaults["city"], name=defaults["name"])
+                district = District.objects.get(city_id=defaults["city_id"], name=defaults["name"])
 
             # District exists but may not have correct geonameid as id
             # Update all attributes except id
@@ -174,3 +158,71 @@ class DistrictImporter(BaseImporter):
             district, created = District.objects.update_or_create(id=geonameid, defaults=defaults)
 
         return district, created
+
+    def create_or_update_batch(self, parsed_batch):
+        """
+        Create or update a batch of district records with bulk queries
+
+        Follows the same rules as create_or_update(), applied row by row:
+        a district matching (city, name) is updated and keeps its id;
+        otherwise the district with the geonameid is updated or created.
+        Existing districts are loaded in two queries, then the batch is
+        written with one bulk_update() and one bulk_create().
+        """
+        keys = set((parsed["defaults"]["city_id"], parsed["defaults"]["name"]) for parsed in parsed_batch)
+        existing = District.objects.filter(
+            city_id__in=set(city_id for city_id, name in keys),
+            name__in=set(name for city_id, name in keys),
+        )
+        # (city, name) is unique, so each key matches at most one district
+        by_key = {
+            (district.city_id, district.name): district
+            for district in existing
+            if (district.city_id, district.name) in keys
+        }
+        by_id = {district.id: district for district in by_key.values()}
+        missing_ids = set(parsed["id"] for parsed in parsed_batch) - set(by_id)
+        by_id.update(District.objects.in_bulk(missing_ids))
+
+        to_create = {}
+        to_update = {}
+        update_fields = {"slug"}
+        results = []
+
+        for parsed in parsed_batch:
+            defaults = parsed["defaults"]
+            key = (defaults["city_id"], defaults["name"])
+
+            district = by_key.get(key) or by_id.get(parsed["id"])
+            created = district is None
+            if created:
+                district = District(id=parsed["id"])
+                to_create[district.id] = district
+            else:
+                old_key = (district.city_id, district.name)
+                if by_key.get(old_key) is district:
+                    del by_key[old_key]
+                if district.id not in to_create:
+                    to_update[district.id] = district
+
+            for field, value in defaults.items():
+                setattr(district, field, value)
+            update_fields.update(defaults)
+
+            # What save() would have done before writing
+            district.clean()
+            district.set_slug()
+
+            by_key[key] = district
+            by_id[district.id] = district
+            results.append((district, created))
+
+        with transaction.atomic():
+            if to_update:
+                District.objects.bulk_update(
+                    list(to_update.values()), [District._meta.get_field(e).name for e in sorted(update_fields)]
+                )
+            if to_create:
+                District.objects.bulk_create(list(to_create.values()))
+
+        return results
@@ -1,18 +1,269 @@
 """Postal code importer"""
 
+import multiprocessing
 import re
+import traceback
 
-from django.db import transaction
-from django.db.models import Q
+from django.db import connection, connections, transaction
+from django.db.models import F
+from tqdm import tqdm
 
 from ..conf import VALIDATE_POSTAL_CODES, settings
 from ..exceptions import ValidationError
 from ..models import District, PostalCode, Region, Subregion
+from ..util import DeferredPoint
 from .base import BaseImporter
 
 # Maximum place name length (matches model field max_length)
 PLACE_NAME_MAX_LENGTH = 200
 
+# Importer used by worker processes, inherited when they are forked
+_worker_importer = None
+
+
+def _import_country(task):
+    """
+    Import one country's postal codes in a worker process
+
+    Args:
+        task: (country code, rows) tuple
+
+    Returns:
+        tuple: (country code, ids of districts to delete, formatted traceback
+        of the error or None)
+    """
+    country_code, rows = task
+    importer = _worker_importer
+    importer.existing_postal_codes = None
+    importer.region_names = None
+    importer.districts_to_delete = set()
+
+    try:
+        # Each country is committed on its own
+        with transaction.atomic():
+            BaseImporter.import_records(importer, rows)
+        return country_code, importer.districts_to_delete, None
+    except Exception:
+        return country_code, set(), traceback.format_exc()
+    finally:
+        connections.close_all()
+
+
+def _iexact(value, other):
+    """In-memory equivalent of an iexact lookup"""
+    return value is not None and value.casefold() == other.casefold()
+
+
+class ExistingPostalCodes:
+    """
+    In-memory copy of one country's existing postal codes
+
+    Answers the lookups of PostalCodeImporter._find_existing_postal_code()
+    from the objects loaded with one query: candidates are found by code (or
+    by region code) in a dict and checked against the strategy's remaining
+    conditions in Python. Postal codes the importer saves are added back, so
+    later rows see them as they would in the database.
+    """
+
+    def __init__(self, country):
+        """
+        Load a country's postal codes
+
+        Args:
+            country: Country instance
+        """
+        self.country = country
+        self.by_code = {}
+        self.by_region_code = {}
+        # {id: (region code, subregion code, district code, (x, y))}
+        self.keys = {}
+
+        qs = PostalCode.objects.filter(country=country).annotate(
+            matched_region_code=F("region__code"),
+            matched_subregion_code=F("subregion__code"),
+            matched_district_code=F("district__code"),
+        )
+        for pc in qs.iterator(chunk_size=2000):
+            location = (pc.location.x, pc.location.y) if pc.location is not None else None
+            self._add(pc, pc.matched_region_code, pc.matched_subregion_code, pc.matched_district_code, location)
+
+    def _add(self, pc, region_code, subregion_code, district_code, location):
+        self.by_code.setdefault(pc.code, []).append(pc)
+        self.by_region_code.setdefault(region_code, []).append(pc)
+        self.keys[pc.id] = (region_code, subregion_code, district_code, location)
+
+    def update(self, pc, codes, coordinates):
+        """
+        Record a postal code the importer has just saved
+
+        Args:
+            pc: Saved PostalCode
+            codes: (region code, subregion code, district code) it links to
+            coordinates: (longitude, latitude) it was saved with, or None
+        """
+        region_code, subregion_code, district_code = codes
+
+        old_keys = self.keys.get(pc.id)
+        if old_keys is None:
+            self._add(pc, region_code, subregion_code, district_code, coordinates)
+            return
+
+        if coordinates is None:
+            coordinates = old_keys[3]
+        if old_keys[0] != region_code:
+            self.by_region_code[old_keys[0]] = [e for e in self.by_region_code[old_keys[0]] if e.id != pc.id]
+            self.by_region_code.setdefault(region_code, []).append(pc)
+        self.keys[pc.id] = (region_code, subregion_code, district_code, coordinates)
+
+    def get(self, candidates, predicate, description):
+        """
+        Return the one candidate matching predicate, like QuerySet.get()
+
+        Args:
+            candidates: PostalCodes to check
+            predicate: Function (pc, keys) -> bool
+            description: Lookup description for the error message
+
+        Returns:
+            PostalCode, or None if no candidate matches
+
+        Raises:
+            PostalCode.MultipleObjectsReturned: If several candidates match
+        """
+        matches = [pc for pc in candidates if predicate(pc, self.keys[pc.id])]
+        if not matches:
+            return None
+        if len(matches) > 1:
+            raise PostalCode.MultipleObjectsReturned(
+                "{} postal codes match {}: {}".format(len(matches), description, [pc.id for pc in matches])
+            )
+        return matches[0]
+
+
+class RegionNameTables:
+    """
+    Casefolded name lookups for one country's regions, subregions and districts
+
+    Answers the name_std/name iexact lookups of
+    PostalCodeImporter._link_regions() from dictionaries built with one
+    values_list() query per model. Duplicate districts are resolved once per
+    name and the result is reused for every postal code that names them.
+    """
+
+    def __init__(self, country):
+        """
+        Load a country's region, subregion and district names
+
+        Args:
+            country: Country instance
+        """
+        self.country = country
+        # {casefolded name: {region id}}
+        self.regions = {}
+        # {casefolded name: {subregion id: region id}}
+        self.subregions = {}
+        # {casefolded name: {district id: (city id, region id)}}
+        self.districts = {}
+        # {id: code}
+        self.region_codes = {}
+        self.subregion_codes = {}
+        self.district_codes = {}
+        # {(casefolded region name, casefolded district name): district id}
+        self.resolved_districts = {}
+
+        for region_id, name, name_std, code in Region.objects.filter(country=country).values_list(
+            "id", "name", "name_std", "code"
+        ):
+            self.region_codes[region_id] = code
+            for key in self._keys(name, name_std):
+                self.regions.setdefault(key, set()).add(region_id)
+
+        for subregion_id, name, name_std, code, region_id in Subregion.objects.filter(
+            region__country=country
+        ).values_list("id", "name", "name_std", "code", "region_id"):
+            self.subregion_codes[subregion_id] = code
+            for key in self._keys(name, name_std):
+                self.subregions.setdefault(key, {})[subregion_id] = region_id
+
+        for district_id, name, name_std, code, city_id, region_id in District.objects.filter(
+            city__country=country
+        ).values_list("id", "name", "name_std", "code", "city_id", "city__region_id"):
+            self.district_codes[district_id] = code
+            for key in self._keys(name, name_std):
+                self.districts.setdefault(key, {})[district_id] = (city_id, region_id)
+
+    @staticmethod
+    def _keys(name, name_std):
+        return {value.casefold() for value in (name, name_std) if value is not None}
+
+    def find_region(self, region_name):
+        """
+        Return the id of the region named region_name
+
+        Raises:
+            Region.MultipleObjectsReturned: If several regions have that name
+        """
+        region_ids = self.regions.get(region_name.casefold(), ())
+        if len(region_ids) > 1:
+            raise Region.MultipleObjectsReturned("Multiple regions named {!r}".format(region_name))
+        return next(iter(region_ids), None)
+
+    def find_subregion(self, region_name, subregion_name):
+        """
+        Return the id of the subregion named subregion_name in a region named region_name
+
+        Raises:
+            Subregion.MultipleObjectsReturned: If several subregions match
+        """
+        region_ids = self.regions.get(region_name.casefold(), ())
+        subregions = self.subregions.get(subregion_name.casefold(), {})
+        subregion_ids = [e for e, region_id in subregions.items() if region_id in region_ids]
+        if len(subregion_ids) > 1:
+            raise Subregion.MultipleObjectsReturned("Multiple subregions named {!r}".format(subregion_name))
+        return subregion_ids[0] if subregion_ids else None
+
+    def find_district(self, region_name, district_name):
+        """
+        Return the district named district_name in a region named region_name
+
+        Several districts of the same city with that name are duplicates: the
+        one with the lowest id is kept and the one with the highest id is
+        returned for deletion.
+
+        Returns:
+            tuple: (district id, city id, id of a duplicate district to delete),
+            each None if there is none
+
+        Raises:
+            District.MultipleObjectsReturned: If districts of different cities match
+        """
+        key = (region_name.casefold(), district_name.casefold())
+        if key not in self.resolved_districts:
+            region_ids = self.regions.get(key[0], ())
+            districts = self.districts.get(key[1], {})
+            matches = sorted(
+                (district_id, city_id)
+                for district_id, (city_id, region_id) in districts.items()
+                if region_id in region_ids
+            )
+
+            if not matches:
+                resolved = (None, None, None)
+            elif len(matches) == 1:
+                resolved = (matches[0][0], matches[0][1], None)
+            elif len({city_id for _, city_id in matches}) == 1:
+                resolved = (matches[0][0], matches[0][1], matches[-1][0])
+            else:
+                resolved = District.MultipleObjectsReturned(
+                    "Multiple districts in different cities: {}".format([e for e, _ in matches])
+                )
+            self.resolved_districts[key] = resolved
+
+        resolved = self.resolved_districts[key]
+        if isinstance(resolved, Exception):
+            raise resolved
+        return resolved
+
 
 class PostalCodeImporter(BaseImporter):
     """Imports postal code data from GeoNames"""
@@ -20,7 +271,10 @@ class PostalCodeImporter(BaseImporter):
     def __init__(self, command, options):
         super().__init__(command, options)
         self.num_existing_postal_codes = 0
-        self.districts_to_delete = []
+        self.districts_to_delete = set()
+        # Existing postal codes and region names of the country being imported
+        self.existing_postal_codes = None
+        self.region_names = None
 
     def get_file_key(self):
         return "postal_code"
@@ -31,23 +285,93 @@ class PostalCodeImporter(BaseImporter):
     def get_description(self):
         return "Importing postal codes"
 
+    def get_country_code(self, item):
+        return item.get("countryCode")
+
     def build_indices(self):
         """Build required indices"""
         self.country_index = self.index_builder.build_country_index(self.options.get("quiet"))
-        self.region_index = self.index_builder.build_region_index(self.options.get("quiet"))
 
         if VALIDATE_POSTAL_CODES:
             self.postal_code_regex_index = self.index_builder.build_postal_code_regex_index(
                 self.country_index, self.options.get("quiet")
             )
 
-    def load_data(self):
+    def load_data(self, rows=None):
         """Load data and check if optimization can be used"""
         self.num_existing_postal_codes = PostalCode.objects.count()
         if self.num_existing_postal_codes == 0:
             self.logger.debug("Zero postal codes found - using only-create postal code optimization")
 
-        return super().load_data()
+        return super().load_data(rows)
+
+    def import_records(self, data):
+        """
+        Import postal codes, a country per worker process with --postal-code-workers
+
+        Rows are grouped by country and each country is imported and committed
+        by one of the workers, with its own database connection and its own
+        country-scoped lookups. Falls back to importing in this process when
+        workers cannot be used.
+
+        Args:
+            data: List of raw postal code dicts
+        """
+        workers = self.options.get("postal_code_workers") or 1
+        context = self._get_worker_context() if workers > 1 else None
+        if context is None:
+            super().import_records(data)
+            return
+
+        rows_by_country = {}
+        for item in data:
+            rows_by_country.setdefault(self.get_country_code(item), []).append(item)
+        if not rows_by_country:
+            return
+
+        global _worker_importer
+        _worker_importer = self
+        # Workers must open their own connections rather than share ours
+        connections.close_all()
+        # Workers stay quiet; progress is shown per country here
+        options = self.options
+        self.options = dict(options, quiet=True)
+
+        try:
+            with context.Pool(min(workers, len(rows_by_country))) as pool:
+                # Largest countries first, so they do not finish last
+                tasks = sorted(rows_by_country.items(), key=lambda e: len(e[1]), reverse=True)
+                for country_code, districts_to_delete, error in tqdm(
+                    pool.imap_unordered(_import_country, tasks),
+                    disable=options.get("quiet"),
+                    total=len(tasks),
+                    desc=self.get_description(),
+                ):
+                    if error is not None:
+                        self.logger.error("Error importing %s postal codes:\n%s", country_code, error)
+                    self.districts_to_delete.update(districts_to_delete)
+        finally:
+            _worker_importer = None
+            self.options = options
+
+    def _get_worker_context(self):
+        """
+        Return the multiprocessing context for worker processes
+
+        Returns:
+            Context to fork workers with, or None if they cannot be used
+        """
+        if connection.in_atomic_block:
+            self.logger.warning("Importing postal codes serially: workers cannot see uncommitted data")
+            return None
+        if connection.vendor == "sqlite":
+            self.logger.warning("Importing postal codes serially: SQLite does not allow concurrent writers")
+            return None
+        try:
+            return multiprocessing.get_context("fork")
+        except ValueError:
+            self.logger.warning("Importing postal codes serially: worker processes need fork()")
+            return None
 
     def parse_item(self, item):
         """Parse postal code data"""
@@ -72,10 +396,12 @@ class PostalCodeImporter(BaseImporter):
 
         # Parse location
         try:
-            location = self.validator.parse_location(
+            coordinates = self.validator.parse_coordinates(
                 item.get("latitude"), item.get("longitude"), entity_type="PostalCode"
             )
+            location = DeferredPoint(*coordinates)
         except ValidationError:
+            coordinates = None
             location = None
 
         # Warn about long names
@@ -95,6 +421,7 @@ class PostalCodeImporter(BaseImporter):
             "district_name": item.get("admin3Name", ""),
             "district_code": item.get("admin3Code", ""),
             "location": location,
+            "coordinates": coordinates,
             "item": item,  # Keep original for hooks
         }
 
@@ -110,9 +437,15 @@ class PostalCodeImporter(BaseImporter):
         district_name = parsed_data["district_name"]
         district_code = parsed_data["district_code"]
         location = parsed_data["location"]
+        coordinates = parsed_data["coordinates"]
 
         # If postal codes exist, try to find existing one using query strategies
         if self.num_existing_postal_codes > 0:
+            # Rows come grouped by country, so only one country is in memory
+            if self.existing_postal_codes is None or self.existing_postal_codes.country.pk != country.pk:
+                self.existing_postal_codes = None
+                self.existing_postal_codes = ExistingPostalCodes(country)
+
             pc = self._find_existing_postal_code(
                 country,
                 code,
@@ -123,7 +456,7 @@ class PostalCodeImporter(BaseImporter):
                 subregion_code,
                 district_name,
                 district_code,
-                location,
+                coordinates,
             )
         else:
             pc = None
@@ -144,14 +477,20 @@ class PostalCodeImporter(BaseImporter):
             created = False
 
         # Lookup region, subregion, district relationships
-        self._link_regions(pc)
+        if self.region_names is None or self.region_names.country.pk != country.pk:
+            self.region_names = None
+            self.region_names = RegionNameTables(country)
+        codes = self._link_regions(pc)
 
         # Set location
-        if location:
+        if location is not None:
             pc.location = location
 
         pc.save()
 
+        if self.existing_postal_codes is not None:
+            self.existing_postal_codes.update(pc, codes, coordinates)
+
         return pc, created
 
     def _find_existing_postal_code(
@@ -165,159 +504,128 @@ class PostalCodeImporter(BaseImporter):
         subregion_code,
         district_name,
         district_code,
-        location,
+        coordinates,
     ):
-        """Try multiple query strategies to find existing postal code"""
-        # Build Q objects for name-based queries
-        reg_name_q = Q(region_name__iexact=region_name)
-        subreg_name_q = Q(subregion_name__iexact=subregion_name)
-        dst_name_q = Q(district_name__iexact=district_name)
-
-        # Add code-based queries if relationships exist
-        if hasattr(PostalCode, "region"):
-            reg_name_q |= Q(region__code=region_code)
-        if hasattr(PostalCode, "subregion"):
-            subreg_name_q |= Q(subregion__code=subregion_code)
-        if hasattr(PostalCode, "district") and hasattr(District, "code"):
-            dst_name_q |= Q(district__code=district_code)
-
-        # Define query strategies in order of specificity
-        postal_code_args = (
-            {"args": (reg_name_q, subreg_name_q, dst_name_q), "country": country, "code": code, "location": location},
-            {"args": (reg_name_q, subreg_name_q, dst_name_q), "country": country, "code": code},
-            {
-                "args": (reg_name_q, subreg_name_q, dst_name_q),
-                "country": country,
-                "code": code,
-                "name__iexact": re.sub("'", "", place_name),
-            },
-            {"args": tuple(), "country": country, "region__code": region_code},
-            {
-                "args": tuple(),
-                "country": country,
-                "code": code,
-                "name": place_name,
-                "region__code": region_code,
-                "subregion__code": subregion_code,
-            },
-            {
-                "args": tuple(),
-                "country": country,
-                "code": code,
-                "name": place_name,
-                "region__code": region_code,
-                "subregion__code": subregion_code,
-                "district__code": district_code,
-            },
-            {
-                "args": tuple(),
-                "country": country,
-                "code": code,
-                "name": place_name,
-                "region_name": region_name,
-                "subregion_name": subregion_name,
-            },
-            {
-                "args": tuple(),
-                "country": country,
-                "code": code,
-                "name": place_name,
-                "region_name": region_name,
-                "subregion_name": subregion_name,
-                "district_name": district_name,
-            },
+        """
+        Try multiple lookup strategies to find existing postal code
+
+        The strategies are evaluated against the country's postal codes in
+        memory (see ExistingPostalCodes); each one matches what a
+        PostalCode.objects.get() with these conditions would.
+        """
+        existing = self.existing_postal_codes
+        by_code = existing.by_code.get(code, [])
+
+        has_region = hasattr(PostalCode, "region")
+        has_subregion = hasattr(PostalCode, "subregion")
+        has_district_code = hasattr(PostalCode, "district") and hasattr(District, "code")
+
+        # Name conditions, or'ed with code conditions if relationships exist
+        def names_match(pc, keys):
+            return (
+                (_iexact(pc.region_name, region_name) or (has_region and keys[0] == region_code))
+                and (_iexact(pc.subregion_name, subregion_name) or (has_subregion and keys[1] == subregion_code))
+                and (_iexact(pc.district_name, district_name) or (has_district_code and keys[2] == district_code))
+            )
+
+        plain_place_name = re.sub("'", "", place_name)
+
+        # Strategies in order of specificity: (candidates, condition, description)
+        strategies = (
+            (by_code, lambda pc, keys: names_match(pc, keys) and keys[3] == coordinates, "code, names and location"),
+            (by_code, names_match, "code and names"),
+            (
+                by_code,
+                lambda pc, keys: names_match(pc, keys) and _iexact(pc.name, plain_place_name),
+                "code, names and place name",
+            ),
+            (existing.by_region_code.get(region_code, []), lambda pc, keys: True, "region code"),
+            (
+                by_code,
+                lambda pc, keys: pc.name == place_name and keys[0] == region_code and keys[1] == subregion_code,
+                "code, place name, region and subregion codes",
+            ),
+            (
+                by_code,
+                lambda pc, keys: (
+                    pc.name == place_name
+                    and keys[0] == region_code
+                    and keys[1] == subregion_code
+                    and keys[2] == district_code
+                ),
+                "code, place name, region, subregion and district codes",
+            ),
+            (
+                by_code,
+                lambda pc, keys: (
+                    pc.name == place_name and pc.region_name == region_name and pc.subregion_name == subregion_name
+                ),
+                "code, place name, region and subregion names",
+            ),
+            (
+                by_code,
+                lambda pc, keys: (
+                    pc.name == place_name
+                    and pc.region_name == region_name
+                    and pc.subregion_name == subregion_name
+                    and pc.district_name == district_name
+                ),
+                "code, place name, region, subregion and district names",
+            ),
         )
 
-        # Try each query strategy until we find a match
-        for args_dict in postal_code_args:
+        # Try each strategy until we find a match
+        for candidates, predicate, description in strategies:
             try:
-                return PostalCode.objects.get(
-                    *args_dict["args"],
-                    **{k: v for k, v in args_dict.items() if k != "args"},
-                )
-            except PostalCode.DoesNotExist:
-                continue
-            except PostalCode.MultipleObjectsReturned:
-                pcs = PostalCode.objects.filter(
-                    *args_dict["args"],
-                    **{k: v for k, v in args_dict.items() if k != "args"},
-                )
-                self.logger.debug("Multiple postal codes found: %s", pcs)
+                pc = existing.get(candidates, predicate, description)
+            except PostalCode.MultipleObjectsReturned as e:
+                self.logger.debug("Multiple postal codes found: %s", e)
                 raise
+            if pc is not None:
+                return pc
 
         return None
 
     def _link_regions(self, pc):
-        """Link postal code to region, subregion, district"""
+        """
+        Link postal code to region, subregion, district
+
+        Returns:
+            tuple: Codes of the linked (region, subregion, district), None
+            where there is no link
+        """
+        names = self.region_names
+
         # Link region
         if pc.region_name != "":
-            try:
-                with transaction.atomic():
-                    pc.region = Region.objects.get(
-                        Q(name_std__iexact=pc.region_name) | Q(name__iexact=pc.region_name),
-                        country=pc.country,
-                    )
-            except Region.DoesNotExist:
-                pc.region = None
+            pc.region_id = names.find_region(pc.region_name)
         else:
-            pc.region = None
+            pc.region_id = None
 
         # Link subregion
         if pc.subregion_name != "":
-            try:
-                with transaction.atomic():
-                    pc.subregion = Subregion.objects.get(
-                        Q(region__name_std__iexact=pc.region_name) | Q(region__name__iexact=pc.region_name),
-                        Q(name_std__iexact=pc.subregion_name) | Q(name__iexact=pc.subregion_name),
-                        region__country=pc.country,
-                    )
-            except Subregion.DoesNotExist:
-                pc.subregion = None
+            pc.subregion_id = names.find_subregion(pc.region_name, pc.subregion_name)
         else:
-            pc.subregion = None
+            pc.subregion_id = None
 
-        # Link district
+        # Link district, and city from district
         if pc.district_name != "":
-            try:
-                with transaction.atomic():
-                    pc.district = District.objects.get(
-                        Q(city__region__name_std__iexact=pc.region_name) | Q(city__region__name__iexact=pc.region_name),
-                        Q(name_std__iexact=pc.district_name) | Q(name__iexact=pc.district_name),
-                        city__country=pc.country,
-                    )
-            except District.MultipleObjectsReturned:
-                # Handle duplicate districts - use one from same city
-                pc.district = self._resolve_duplicate_districts(pc)
-            except District.DoesNotExist:
-                pc.district = None
+            pc.district_id, pc.city_id, district_to_delete_id = names.find_district(pc.region_name, pc.district_name)
+            if district_to_delete_id is not None:
+                self.logger.debug(
+                    "Multiple districts found for %s, deleting %d", pc.district_name, district_to_delete_id
+                )
+                self.districts_to_delete.add(district_to_delete_id)
         else:
-            pc.district = None
+            pc.district_id = None
+            pc.city_id = None
 
-        # Link city from district
-        if pc.district is not None:
-            pc.city = pc.district.city
-        else:
-            pc.city = None
-
-    def _resolve_duplicate_districts(self, pc):
-        """Handle multiple districts with same name"""
-        districts = District.objects.filter(
-            Q(city__region__name_std__iexact=pc.region_name) | Q(city__region__name__iexact=pc.region_name),
-            Q(name_std__iexact=pc.district_name) | Q(name__iexact=pc.district_name),
-            city__country=pc.country,
+        return (
+            names.region_codes.get(pc.region_id),
+            names.subregion_codes.get(pc.subregion_id),
+            names.district_codes.get(pc.district_id),
         )
 
-        self.logger.debug("Multiple districts found: %s", districts.values_list("id", flat=True))
-
-        # If they're all part of the same city, use the one with lower ID
-        if districts.values_list("city").distinct().count() == 1:
-            district_to_keep = districts.order_by("city__id").first()
-            district_to_delete_id = districts.order_by("city__id").last().id
-            self.districts_to_delete.append(district_to_delete_id)
-            return district_to_keep
-        else:
-            raise District.MultipleObjectsReturned("Multiple districts in different cities")
-
     def cleanup(self):
         """Delete duplicate districts marked for deletion"""
         if self.districts_to_delete:
@@ -24,6 +24,9 @@ class RegionImporter(BaseImporter):
     def get_description(self):
         return "Importing regions"
 
+    def get_country_code(self, item):
+        return item.get("code", "").split(".")[0]
+
     def build_indices(self):
         """Build country index"""
         self.country_index = self.index_builder.build_country_index(self.options.get("quiet"))
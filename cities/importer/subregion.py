@@ -24,10 +24,12 @@ class SubregionImporter(BaseImporter):
     def get_description(self):
         return "Importing subregions"
 
+    def get_country_code(self, item):
+        return item.get("code", "").split(".")[0]
+
     def build_indices(self):
-        """Build country and region indices"""
-        self.country_index = self.index_builder.build_country_index(self.options.get("quiet"))
-        self.region_index = self.index_builder.build_region_index(self.options.get("quiet"))
+        """Build region id index"""
+        self.region_index = self.index_builder.build_region_id_index(self.options.get("quiet"))
 
     def parse_item(self, item):
         """Parse subregion data"""
@@ -49,7 +51,7 @@ class SubregionImporter(BaseImporter):
         # Look up region
         region_key = country_code + "." + region_code
         try:
-            defaults["region"] = self.validator.lookup_foreign_key(
+            defaults["region_id"] = self.validator.lookup_foreign_key(
                 self.region_index, region_key, "Region", entity_type="Subregion"
             )
         except ValidationError:
@@ -12,17 +12,24 @@ http://download.geonames.org/export/dump/
 
 http://download.geonames.org/export/zip/
 - Postal Codes:         allCountries.zip
+
+With CITIES_COUNTRY_FILES set, cities, alternative names and postal codes are
+read from the per-country extracts (dump/XX.zip, dump/alternatenames/XX.zip
+and zip/XX.zip) instead.
 """
 
 import logging
 import os
+from collections import Counter
+from contextlib import nullcontext
 
-from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
 from swapper import load_model
 from tqdm import tqdm
 
-from ...conf import HookException, import_opts, import_opts_all, settings
+from ...conf import HookException, country_lookups, import_opts, import_opts_all, settings
 from ...importer import (
     AlternativeNameImporter,
     CityImporter,
@@ -32,7 +39,9 @@ from ...importer import (
     RegionImporter,
     SubregionImporter,
 )
-from ...models import District, PostalCode, Region, Subregion
+from ...models import AlternativeName, District, PostalCode, Region, Subregion
+from ...services import Flusher, InitialLoad, Maintenance, ShadowTables
+from ...services.maintenance import MAINTENANCE_TASKS
 
 # Load swappable models
 Continent = load_model("cities", "Continent")
@@ -42,6 +51,9 @@ City = load_model("cities", "City")
 # Only log errors during Travis tests
 LOGGER_NAME = os.environ.get("TRAVIS_LOGGER_NAME", "cities")
 
+# Alternative names deleted per chunk by a flush scoped to countries
+FLUSH_ALT_NAME_CHUNK_SIZE = 10000
+
 
 class Command(BaseCommand):
     """
@@ -61,6 +73,17 @@ class Command(BaseCommand):
         "alt_name": AlternativeNameImporter,
     }
 
+    # Map import types to the models they write to
+    MODELS = {
+        "country": Country,
+        "region": Region,
+        "subregion": Subregion,
+        "city": City,
+        "district": District,
+        "postal_code": PostalCode,
+        "alt_name": AlternativeName,
+    }
+
     if hasattr(settings, "data_dir"):
         data_dir = settings.data_dir
     else:
@@ -91,6 +114,21 @@ class Command(BaseCommand):
             dest="flush",
             help="Selectively flush data. Comma separated list of data types.",
         )
+        parser.add_argument(
+            "--flush-strategy",
+            choices=("delete", "fast", "truncate"),
+            default="delete",
+            dest="flush_strategy",
+            help="How to flush: 'delete' with Django's collector (sends signals), 'fast' with set-based "
+            "statements, or 'truncate' with TRUNCATE ... CASCADE on PostgreSQL for unscoped flushes.",
+        )
+        parser.add_argument(
+            "--countries",
+            metavar="COUNTRY_CODES",
+            default="",
+            dest="countries",
+            help="Only import or flush data for these countries. Comma separated list of country codes.",
+        )
         parser.add_argument(
             "--quiet",
             action="store_true",
@@ -98,21 +136,50 @@ class Command(BaseCommand):
             dest="quiet",
             help="Do not show the progress bar.",
         )
+        parser.add_argument(
+            "--initial-load",
+            action="store_true",
+            default=False,
+            dest="initial_load",
+            help="Load empty tables without foreign key and index upkeep, and rebuild them at the end.",
+        )
+        parser.add_argument(
+            "--shadow-swap",
+            action="store_true",
+            default=False,
+            dest="shadow_swap",
+            help="Import into shadow copies of the tables and swap them in at the end (PostgreSQL only).",
+        )
+        parser.add_argument(
+            "--maintenance",
+            metavar="TASKS",
+            default="",
+            dest="maintenance",
+            help="Maintain the imported tables afterwards. Comma separated list of tasks: all, "
+            + ", ".join(MAINTENANCE_TASKS),
+        )
+        parser.add_argument(
+            "--postal-code-workers",
+            type=int,
+            default=1,
+            dest="postal_code_workers",
+            help="Import postal codes with this many worker processes, one country at a time each.",
+        )
 
-    @transaction.atomic
     def handle(self, *args, **options):
         """Main entry point for command"""
         self.options = options
 
+        # Normalize the country restriction shared by importers and flushes
+        countries = [e.strip().upper() for e in self.options.get("countries", "").split(",")]
+        self.countries = sorted(set(e for e in countries if e))
+        self.options["countries"] = self.countries
+
         # Handle flush operations
         self.flushes = [e for e in self.options.get("flush", "").split(",") if e]
         if "all" in self.flushes:
             self.flushes = import_opts_all
 
-        for flush in self.flushes:
-            flush_func = getattr(self, "flush_" + flush)
-            flush_func()
-
         # Handle import operations
         self.imports = [e for e in self.options.get("import", "").split(",") if e]
         if "all" in self.imports:
@@ -122,24 +189,168 @@ class Command(BaseCommand):
         if self.flushes:
             self.imports = []
 
-        for import_type in self.imports:
-            self._run_importer(import_type)
+        # Postal code workers only see committed data, so with workers the
+        # imports before postal codes are committed first and postal codes
+        # are committed per country, outside the transaction
+        imports, later_imports = self.imports, None
+        if (self.options.get("postal_code_workers") or 1) > 1 and "postal_code" in self.imports:
+            position = self.imports.index("postal_code")
+            imports, later_imports = self.imports[:position], self.imports[position + 1 :]
+
+        # Check the maintenance tasks before the import rather than after it
+        tasks = [e.strip() for e in self.options.get("maintenance", "").split(",") if e.strip()]
+        if "all" in tasks:
+            tasks = list(MAINTENANCE_TASKS)
+        unknown = [e for e in tasks if e not in MAINTENANCE_TASKS]
+        if unknown:
+            raise CommandError("Unknown maintenance tasks: {}".format(", ".join(unknown)))
+
+        if self.options.get("shadow_swap"):
+            self._run_with_shadow_tables(imports, later_imports)
+        else:
+            if self.options.get("initial_load") and self.imports:
+                initial_load = InitialLoad(self.get_import_models(self.imports))
+            else:
+                initial_load = nullcontext()
+
+            with initial_load:
+                self._run(imports, later_imports)
+
+        if tasks and self.imports:
+            timings = Maintenance(self.get_import_models(self.imports)).run(tasks)
+            self.logger.info(
+                "Maintenance of %d tables took %.1fs", len(set(e[1] for e in timings)), sum(e[2] for e in timings)
+            )
+
+    def _run(self, imports, later_imports):
+        """
+        Run the flushes and imports, in transactions
 
-    def _run_importer(self, import_type):
+        Args:
+            imports: Import types to run in the first transaction
+            later_imports: Import types to run after the postal codes, which
+                are then imported outside of a transaction, or None
+        """
+        with transaction.atomic():
+            for flush in self.flushes:
+                flush_func = getattr(self, "flush_" + flush)
+                flush_func()
+
+            self._run_importers(imports)
+
+        if later_imports is not None:
+            self._run_importers(["postal_code"])
+
+            with transaction.atomic():
+                self._run_importers(later_imports)
+
+    def _run_with_shadow_tables(self, imports, later_imports):
+        """
+        Run the flushes and imports against shadow tables, then swap them in
+
+        All the app's tables are shadowed, as they reference each other. The
+        shadow tables are unlogged while they are loaded. The live data is
+        copied into them without foreign keys and secondary indexes, which
+        are then rebuilt, so the import's lookups use them; tables that are
+        still empty are imported into without them (see InitialLoad).
+        """
+        if connection.vendor != "postgresql":
+            raise CommandError("--shadow-swap requires PostgreSQL")
+
+        models = []
+        for model in (Continent, Country, Region, Subregion, City, District, PostalCode, AlternativeName):
+            models.append(model)
+            for field in model._meta.local_many_to_many:
+                if field.remote_field.through._meta.auto_created:
+                    models.append(field.remote_field.through)
+
+        with ShadowTables(models) as shadow_tables:
+            shadow_tables.set_logged(False)
+            with InitialLoad(models):
+                shadow_tables.copy_live_data()
+            # Only tables the copy left empty are loaded without indexes
+            with InitialLoad(models):
+                self._run(imports, later_imports)
+            shadow_tables.set_logged(True)
+            shadow_tables.swap()
+
+    def get_import_models(self, import_types):
         """
-        Run the appropriate importer for the given import type
+        Return the models the given import types write to
 
         Args:
-            import_type: Type of data to import (e.g., 'country', 'city')
+            import_types: Types of data to import (e.g., ['country', 'city'])
+
+        Returns:
+            list: Model classes, including the alternative names' through models
         """
-        try:
-            importer_class = self.IMPORTERS[import_type]
-        except KeyError:
-            self.logger.error("Unknown import type: %s", import_type)
-            return
+        models = []
+        for import_type in import_types:
+            if import_type not in self.MODELS:
+                continue
+            models.append(self.MODELS[import_type])
+            if import_type == "alt_name":
+                for type_ in (Country, Region, Subregion, City, District, PostalCode):
+                    models.append(type_._meta.get_field("alt_names").remote_field.through)
+        return models
+
+    def _run_importers(self, import_types):
+        """
+        Run the importers for the given import types, in order
 
-        importer = importer_class(self, self.options)
-        importer.run()
+        A data file that several of the importers read (e.g. the city file,
+        read for cities and districts) is downloaded and read once: each row
+        is routed to every importer that keeps it, and each importer then
+        runs on its rows once the importers before it are done.
+
+        Args:
+            import_types: Types of data to import (e.g., ['country', 'city'])
+        """
+        importers = []
+        for import_type in import_types:
+            try:
+                importer_class = self.IMPORTERS[import_type]
+            except KeyError:
+                self.logger.error("Unknown import type: %s", import_type)
+                continue
+            importers.append(importer_class(self, self.options))
+
+        readers = Counter(importer.get_file_key() for importer in importers)
+        rows = {}
+        for importer in importers:
+            file_key = importer.get_file_key()
+            if readers[file_key] > 1 and file_key not in rows:
+                rows.update(self._read_shared_file(file_key, importer.downloader, importer.parser, importers))
+
+            importer.run(rows.pop(importer, None))
+
+    def _read_shared_file(self, file_key, downloader, parser, importers):
+        """
+        Read a data file once for all the importers that read it
+
+        Args:
+            file_key: Key from settings.files dict
+            downloader: Downloader to fetch the file with
+            parser: Parser to read the file with
+            importers: Importers, of which those reading file_key get rows
+
+        Returns:
+            dict: {importer: list of the rows it keeps}
+        """
+        downloader.download(file_key)
+        readers = [importer for importer in importers if importer.get_file_key() == file_key]
+        rows = {importer: [] for importer in readers}
+
+        for item in tqdm(
+            parser.get_data(file_key),
+            disable=self.options.get("quiet"),
+            desc="Reading {} data".format(file_key),
+        ):
+            for importer in readers:
+                if importer.wants_item(item):
+                    rows[importer].append(item)
+
+        return rows
 
     def call_hook(self, hook, *args, **kwargs):
         """
@@ -167,45 +378,154 @@ class Command(BaseCommand):
 
     # Flush methods
 
+    def get_flush_queryset(self, data_type, model):
+        """
+        Return the queryset a flush should delete, scoped to --countries
+
+        Args:
+            data_type: Data type of the model (e.g., 'city')
+            model: Model class to flush
+
+        Returns:
+            QuerySet: Rows to delete
+        """
+        qs = model.objects.all()
+        if self.countries:
+            qs = qs.filter(**{country_lookups[data_type] + "__in": self.countries})
+        return qs
+
+    def delete_flush_queryset(self, data_type, model):
+        """
+        Delete a model's data, scoped to --countries, with the --flush-strategy
+
+        'fast' and 'truncate' fall back to the next safer strategy when they
+        cannot be used: TRUNCATE needs PostgreSQL, an unscoped flush, and
+        every table it empties through foreign keys to be one the deletion
+        cascades to or one being flushed too; set-based deletes need
+        on_delete handlers they can follow.
+
+        Args:
+            data_type: Data type of the model (e.g., 'city')
+            model: Model class to flush
+        """
+        qs = self.get_flush_queryset(data_type, model)
+        strategy = self.options.get("flush_strategy") or "delete"
+        flusher = Flusher(qs.db)
+
+        if strategy == "truncate":
+            # Alternative name flushes keep the links, so their table is not emptied
+            flushed_models = [self.MODELS[e] for e in self.flushes if e in self.MODELS and e != "alt_name"]
+            if not self.countries and flusher.can_truncate(model, flushed_models):
+                flusher.truncate(model)
+                return
+            self.logger.warning("Cannot truncate %s, deleting with set-based statements", model._meta.label)
+            strategy = "fast"
+
+        if strategy == "fast":
+            if Flusher.can_flush(model):
+                flusher.delete(qs)
+                return
+            self.logger.warning("Cannot flush %s with set-based statements, deleting row by row", model._meta.label)
+
+        total, counts = qs.delete()
+        for label, count in counts.items():
+            self.logger.info("Deleted %d %s rows", count, label)
+
+    def _log_flush(self, description):
+        if self.countries:
+            self.logger.info("Flushing %s data for %s", description, ", ".join(self.countries))
+        else:
+            self.logger.info("Flushing %s data", description)
+
     def flush_country(self):
-        """Delete all country data"""
-        self.logger.info("Flushing country data")
-        Country.objects.all().delete()
+        """Delete country data, scoped to --countries"""
+        self._log_flush("country")
+        self.delete_flush_queryset("country", Country)
 
     def flush_region(self):
-        """Delete all region data"""
-        self.logger.info("Flushing region data")
-        Region.objects.all().delete()
+        """Delete region data, scoped to --countries"""
+        self._log_flush("region")
+        self.delete_flush_queryset("region", Region)
 
     def flush_subregion(self):
-        """Delete all subregion data"""
-        self.logger.info("Flushing subregion data")
-        Subregion.objects.all().delete()
+        """Delete subregion data, scoped to --countries"""
+        self._log_flush("subregion")
+        self.delete_flush_queryset("subregion", Subregion)
 
     def flush_city(self):
-        """Delete all city data"""
-        self.logger.info("Flushing city data")
-        City.objects.all().delete()
+        """Delete city data, scoped to --countries"""
+        self._log_flush("city")
+        self.delete_flush_queryset("city", City)
 
     def flush_district(self):
-        """Delete all district data"""
-        self.logger.info("Flushing district data")
-        District.objects.all().delete()
+        """Delete district data, scoped to --countries"""
+        self._log_flush("district")
+        self.delete_flush_queryset("district", District)
 
     def flush_postal_code(self):
-        """Delete all postal code data"""
-        self.logger.info("Flushing postal code data")
-        PostalCode.objects.all().delete()
+        """Delete postal code data, scoped to --countries"""
+        self._log_flush("postal code")
+        self.delete_flush_queryset("postal_code", PostalCode)
 
     def flush_alt_name(self):
-        """Delete all alternative name data"""
-        self.logger.info("Flushing alternate name data")
-        for type_ in (Country, Region, Subregion, City, District, PostalCode):
-            plural_type_name = type_.__name__ if type_.__name__[-1] != "y" else "{}ies".format(type_.__name__[:-1])
-            for obj in tqdm(
-                type_.objects.all(),
-                disable=self.options.get("quiet"),
-                total=type_.objects.count(),
-                desc="Flushing alternative names for {}".format(plural_type_name),
-            ):
-                obj.alt_names.all().delete()
+        """
+        Delete alternative names of places, scoped to --countries
+
+        Names are deleted with set-based statements: first their rows in the
+        places' through tables, then the names themselves. As with deleting
+        through the places' alt_names, names hidden by the default manager
+        (links) are kept.
+        """
+        self._log_flush("alternate name")
+        flusher = Flusher(AlternativeName.objects.db)
+
+        # (through model, place field, alternative name field, places to flush)
+        through_tables = []
+        for data_type, type_ in (
+            ("country", Country),
+            ("region", Region),
+            ("subregion", Subregion),
+            ("city", City),
+            ("district", District),
+            ("postal_code", PostalCode),
+        ):
+            field = type_._meta.get_field("alt_names")
+            through_tables.append(
+                (
+                    field.remote_field.through,
+                    field.m2m_field_name(),
+                    field.m2m_reverse_field_name(),
+                    self.get_flush_queryset(data_type, type_),
+                )
+            )
+
+        if not self.countries:
+            # Every name goes, including any no longer linked to a place
+            names = AlternativeName.objects.all()
+            for through, place_field, alt_field, places in through_tables:
+                flusher.delete_rows(through.objects.filter(**{alt_field + "__in": names.values("pk")}))
+            # The through rows are gone, so nothing is left to cascade to
+            deleted = flusher.delete_rows(names)
+            self.logger.info("Deleted %d alternative names", deleted)
+            return
+
+        # Names linked to the flushed places
+        linked = Q()
+        for through, place_field, alt_field, places in through_tables:
+            linked |= Q(pk__in=through.objects.filter(**{place_field + "__in": places.values("pk")}).values(alt_field))
+        names = AlternativeName.objects.filter(linked).order_by("pk")
+
+        deleted = 0
+        last_pk = None
+        while True:
+            chunk_names = names if last_pk is None else names.filter(pk__gt=last_pk)
+            ids = list(chunk_names.values_list("pk", flat=True)[:FLUSH_ALT_NAME_CHUNK_SIZE])
+            if not ids:
+                break
+            last_pk = ids[-1]
+
+            for through, place_field, alt_field, places in through_tables:
+                flusher.delete_rows(through.objects.filter(**{alt_field + "__in": ids}))
+            deleted += flusher.delete_rows(AlternativeName._base_manager.filter(pk__in=ids))
+
+        self.logger.info("Deleted %d alternative names", deleted)
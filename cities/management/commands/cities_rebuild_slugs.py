@@ -0,0 +1,145 @@
+"""
+Recompute the slugs of imported places.
+
+Slugs are normally computed when a row is saved. Rows written in bulk, or
+whose slugs were left as 'invalid-...' placeholders, can have their slugs
+rebuilt afterwards with this command. Rows are read in primary key order and
+updated with one bulk UPDATE per chunk.
+"""
+
+import logging
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from swapper import load_model
+from tqdm import tqdm
+
+from ...models import AlternativeName, District, PostalCode, Region, Subregion
+
+# Load swappable models
+Continent = load_model("cities", "Continent")
+Country = load_model("cities", "Country")
+City = load_model("cities", "City")
+
+# Only log errors during Travis tests
+LOGGER_NAME = os.environ.get("TRAVIS_LOGGER_NAME", "cities")
+
+# Rows read and updated per chunk
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Recompute the slugs of imported places in chunks."
+
+    # Map data types to models and the relations their slugify() reads
+    MODELS = {
+        "continent": (Continent, ()),
+        "country": (Country, ()),
+        "region": (Region, ("country",)),
+        "subregion": (Subregion, ()),
+        "city": (City, ()),
+        "district": (District, ()),
+        "postal_code": (PostalCode, ()),
+        "alt_name": (AlternativeName, ()),
+    }
+
+    logger = logging.getLogger(LOGGER_NAME)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--types",
+            metavar="DATA_TYPES",
+            default="all",
+            dest="types",
+            help="Comma separated list of data types: " + ", ".join(self.MODELS),
+        )
+        parser.add_argument(
+            "--only-invalid",
+            action="store_true",
+            default=False,
+            dest="only_invalid",
+            help="Only rebuild missing slugs and 'invalid-...' placeholders.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            dest="chunk_size",
+            help="Rows per bulk update (default: {}).".format(DEFAULT_CHUNK_SIZE),
+        )
+        parser.add_argument(
+            "--quiet",
+            action="store_true",
+            default=False,
+            dest="quiet",
+            help="Do not show the progress bar.",
+        )
+
+    def handle(self, *args, **options):
+        """Main entry point for command"""
+        types = [e.strip() for e in options["types"].split(",") if e.strip()]
+        if "all" in types:
+            types = list(self.MODELS)
+
+        unknown = [e for e in types if e not in self.MODELS]
+        if unknown:
+            raise CommandError("Unknown data types: {}".format(", ".join(unknown)))
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        for data_type in types:
+            model, related = self.MODELS[data_type]
+            updated = self.rebuild_slugs(model, related, options)
+            self.logger.info("Rebuilt %d %s slugs", updated, model._meta.verbose_name)
+
+    def rebuild_slugs(self, model, related, options):
+        """
+        Recompute the slugs of one model
+
+        Args:
+            model: Model class with a slug (a SlugModel)
+            related: Relations to select_related() for slugify()
+            options: Command options
+
+        Returns:
+            int: Number of rows whose slug changed
+        """
+        # The base manager also sees rows a default manager hides, e.g. links
+        qs = model._base_manager.all()
+        if options["only_invalid"]:
+            qs = qs.filter(Q(slug__isnull=True) | Q(slug__startswith="invalid-"))
+        if related:
+            qs = qs.select_related(*related)
+        qs = qs.order_by("pk")
+
+        updated = 0
+        last_pk = None
+        progress = tqdm(
+            disable=options["quiet"],
+            total=qs.count(),
+            desc="Rebuilding {} slugs".format(model._meta.verbose_name),
+        )
+        with progress:
+            while True:
+                # Page by primary key, which stays fast however far in we are
+                chunk_qs = qs if last_pk is None else qs.filter(pk__gt=last_pk)
+                chunk = list(chunk_qs[: options["chunk_size"]])
+                if not chunk:
+                    break
+                last_pk = chunk[-1].pk
+
+                changed = []
+                for obj in chunk:
+                    old_slug = obj.slug
+                    if obj.set_slug() != old_slug:
+                        changed.append(obj)
+
+                if changed:
+                    with transaction.atomic():
+                        model._base_manager.bulk_update(changed, ["slug"])
+                    updated += len(changed)
+                progress.update(len(chunk))
+
+        return updated
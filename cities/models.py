@@ -11,6 +11,7 @@ from model_utils import Choices
 
 from .conf import ALTERNATIVE_NAME_TYPES, SLUGIFY_FUNCTION
 from .managers import AlternativeNameManager
+from .util import default_slugify, fast_slugify
 
 # Constants
 INVALID_SLUG_LENGTH = 20  # Length of random string for invalid slugs
@@ -28,7 +29,9 @@ __all__ = [
 ]
 
 
-slugify_func = SLUGIFY_FUNCTION
+# Models slugify plain strings, so the default function can skip its lazy
+# wrapper; any other function is used as configured
+slugify_func = fast_slugify if SLUGIFY_FUNCTION is default_slugify else SLUGIFY_FUNCTION
 
 
 def SET_NULL_OR_CASCADE(collector, field, sub_objs, using):
@@ -47,8 +50,22 @@ class SlugModel(models.Model):
     def slugify(self):
         raise NotImplementedError("Subclasses of Place must implement slugify()")
 
-    def save(self, *args, **kwargs):
+    def set_slug(self):
+        """
+        Compute the slug from the object's current fields
+
+        save() calls this itself. Code writing rows without save(), e.g. with
+        bulk_create() or bulk_update(), must call it first; for models whose
+        slug contains the id, the id must be set by then.
+
+        Returns:
+            str: The new slug, or None if it needs an id the object lacks
+        """
         self.slug = slugify_func(self, self.slugify())
+        return self.slug
+
+    def save(self, *args, **kwargs):
+        self.set_slug()
         # If the slug contains the object's ID and we are creating a new object,
         # save it twice: once to get an ID, another to set the object's slug
         if self.slug is None and getattr(self, "slug_contains_id", False):
@@ -1,8 +1,12 @@
 """Services for django-cities data import"""
 
+from .bulk_load import InitialLoad
 from .downloader import Downloader
+from .flusher import Flusher
 from .index_builder import IndexBuilder
+from .maintenance import Maintenance
 from .parser import Parser
+from .shadow_swap import ShadowTables
 from .validator import Validator
 
-__all__ = ["Downloader", "IndexBuilder", "Parser", "Validator"]
+__all__ = ["Downloader", "Flusher", "IndexBuilder", "InitialLoad", "Maintenance", "Parser", "ShadowTables", "Validator"]
@@ -0,0 +1,156 @@
+"""Faster first-time loading of empty tables"""
+
+import logging
+import os
+
+from django.db import DatabaseError, connections, transaction
+
+LOGGER_NAME = os.environ.get("TRAVIS_LOGGER_NAME", "cities")
+
+
+class InitialLoad:
+    """
+    Context manager that defers index and constraint upkeep of empty tables
+
+    On PostgreSQL, the foreign key constraints and the non-unique secondary
+    indexes (including spatial ones) of the given tables are dropped on
+    entry, then recreated, validated and the tables analyzed on exit. Unique
+    constraints and indexes are kept, since the importers' upserts (e.g.
+    bulk_create(ignore_conflicts=True)) rely on them. On MySQL, foreign key
+    checks are switched off for the session instead. Other databases load as
+    usual.
+
+    Tables that already hold rows are left alone, since their lookups during
+    the import need the indexes. The drops are committed on entry, so the
+    import may use as many transactions as it likes; the indexes are
+    recreated on exit whether or not it succeeded. Each dropped definition is
+    logged, and each is recreated on its own: one that fails (e.g. a foreign
+    key the loaded rows violate) is logged and does not keep the others from
+    being recreated, and the first error is raised once all were tried.
+    """
+
+    def __init__(self, models, using="default"):
+        """
+        Initialize for a set of models
+
+        Args:
+            models: Model classes (including through models) to be loaded
+            using: Database alias
+        """
+        self.models = models
+        self.using = using
+        self.logger = logging.getLogger(LOGGER_NAME)
+        # SQL to recreate what was dropped: (table, name, sql)
+        self.indexes = []
+        self.constraints = []
+        self.tables = []
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def __enter__(self):
+        vendor = self.connection.vendor
+        if vendor == "postgresql":
+            self.tables = [
+                model._meta.db_table for model in self.models if not model._base_manager.using(self.using).exists()
+            ]
+            with self.connection.cursor() as cursor:
+                for table in self.tables:
+                    self._drop_postgresql(cursor, table)
+        elif vendor == "mysql":
+            with self.connection.cursor() as cursor:
+                cursor.execute("SET foreign_key_checks = 0")
+        else:
+            self.logger.warning("Initial load mode is not supported on %s, loading as usual", vendor)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        vendor = self.connection.vendor
+        if vendor == "postgresql":
+            self._restore_postgresql()
+        elif vendor == "mysql":
+            with self.connection.cursor() as cursor:
+                cursor.execute("SET foreign_key_checks = 1")
+        return False
+
+    def _drop_postgresql(self, cursor, table):
+        """Drop and remember a table's foreign keys and non-unique secondary indexes"""
+        table_name = self.connection.ops.quote_name(table)
+
+        cursor.execute(
+            """
+            SELECT c.conname, pg_get_constraintdef(c.oid)
+            FROM pg_constraint c
+            WHERE c.conrelid = %s::regclass AND c.contype = 'f'
+            """,
+            [table_name],
+        )
+        constraints = cursor.fetchall()
+
+        # Indexes that no constraint owns
+        cursor.execute(
+            """
+            SELECT quote_ident(n.nspname) || '.' || quote_ident(i.relname), pg_get_indexdef(x.indexrelid)
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            JOIN pg_namespace n ON n.oid = i.relnamespace
+            WHERE x.indrelid = %s::regclass AND NOT x.indisprimary AND NOT x.indisunique
+            AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+            """,
+            [table_name],
+        )
+        indexes = cursor.fetchall()
+
+        for name, definition in constraints:
+            cursor.execute("ALTER TABLE {} DROP CONSTRAINT {}".format(table_name, self.connection.ops.quote_name(name)))
+            self.constraints.append((table_name, name, definition))
+            self.logger.info("Dropped constraint %s of %s: %s", name, table, definition)
+        for name, definition in indexes:
+            cursor.execute("DROP INDEX {}".format(name))
+            self.indexes.append((table_name, name, definition))
+            self.logger.info("Dropped index %s: %s", name, definition)
+
+    def _restore_postgresql(self):
+        """
+        Recreate the dropped indexes, then the foreign keys, and analyze the tables
+
+        Raises:
+            DatabaseError: The first error recreating an index or constraint,
+                once all were tried
+        """
+        errors = []
+
+        def execute(description, sql):
+            try:
+                with transaction.atomic(using=self.using):
+                    with self.connection.cursor() as cursor:
+                        cursor.execute(sql)
+            except DatabaseError as e:
+                self.logger.error("Could not recreate %s (%s): %s", description, sql, e)
+                errors.append(e)
+
+        for table_name, name, definition in self.indexes:
+            execute("index {}".format(name), definition)
+
+        for table_name, name, definition in self.constraints:
+            execute(
+                "constraint {} of {}".format(name, table_name),
+                "ALTER TABLE {} ADD CONSTRAINT {} {}".format(
+                    table_name, self.connection.ops.quote_name(name), definition
+                ),
+            )
+
+        with self.connection.cursor() as cursor:
+            for table in self.tables:
+                cursor.execute("ANALYZE {}".format(self.connection.ops.quote_name(table)))
+
+        self.logger.info(
+            "Recreated %d of %d indexes and constraints after the initial load",
+            len(self.indexes) + len(self.constraints) - len(errors),
+            len(self.indexes) + len(self.constraints),
+        )
+        self.indexes = []
+        self.constraints = []
+        if errors:
+            raise errors[0]
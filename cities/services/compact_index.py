@@ -0,0 +1,213 @@
+"""Compact integer-keyed indices backed by sorted arrays"""
+
+import heapq
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Set
+
+
+def _tag_run(keys, position, value):
+    """Yield (key, position, value) for a sorted run of keys, for heapq.merge()"""
+    for key in keys:
+        yield key, position, value
+
+
+class SortedIntMap(Mapping):
+    """
+    Read-only mapping of integer keys to integer values
+
+    Keys are kept in one sorted array and values in a parallel array, so an
+    entry costs a few bytes instead of a dict slot and two int objects.
+    Lookups are a binary search over the keys.
+    """
+
+    def __init__(self, keys, values):
+        """
+        Initialize mapping
+
+        Args:
+            keys: Sorted sequence of unique integer keys (e.g., array('q'))
+            values: Sequence of values, parallel to keys
+        """
+        if len(keys) != len(values):
+            raise ValueError("keys and values must have the same length")
+        self._keys = keys
+        self._values = values
+
+    @classmethod
+    def from_pairs(cls, pairs, key_typecode="q", value_typecode="q"):
+        """
+        Build a mapping from (key, value) pairs in any order
+
+        When a key appears more than once the last pair wins, as it would
+        when filling a dict.
+
+        Args:
+            pairs: Iterable of (key, value) tuples
+            key_typecode: array typecode for keys
+            value_typecode: array typecode for values
+
+        Returns:
+            SortedIntMap
+        """
+        keys = array(key_typecode)
+        values = array(value_typecode)
+        for key, value in pairs:
+            keys.append(key)
+            values.append(value)
+        return cls.from_arrays(keys, values)
+
+    @classmethod
+    def from_arrays(cls, keys, values):
+        """
+        Build a mapping from parallel arrays of keys and values in any order
+
+        When a key appears more than once the last value wins.
+
+        Args:
+            keys: array of integer keys
+            values: array of values, parallel to keys
+
+        Returns:
+            SortedIntMap
+        """
+        # Stable sort, so equal keys keep their input order
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        return cls.from_sorted_pairs(((keys[i], values[i]) for i in order), keys.typecode, values.typecode)
+
+    @classmethod
+    def merge(cls, runs, key_typecode="q", value_typecode="q"):
+        """
+        Build a mapping from several runs of sorted keys
+
+        Each run is a (keys, value) tuple: a sorted sequence of keys that all
+        map to the same value. Runs are merged without materializing a sort
+        order; when a key is in several runs the last run wins.
+
+        Args:
+            runs: List of (sorted_keys, value) tuples
+            key_typecode: array typecode for keys
+            value_typecode: array typecode for values
+
+        Returns:
+            SortedIntMap
+        """
+        streams = [_tag_run(keys, position, value) for position, (keys, value) in enumerate(runs)]
+        return cls.from_sorted_pairs(
+            ((key, value) for key, position, value in heapq.merge(*streams)),
+            key_typecode,
+            value_typecode,
+        )
+
+    @classmethod
+    def from_sorted_pairs(cls, pairs, key_typecode="q", value_typecode="q"):
+        """
+        Build a mapping from (key, value) pairs already sorted by key
+
+        When a key appears more than once the last pair wins.
+
+        Args:
+            pairs: Iterable of (key, value) tuples, sorted by key
+            key_typecode: array typecode for keys
+            value_typecode: array typecode for values
+
+        Returns:
+            SortedIntMap
+        """
+        keys = array(key_typecode)
+        values = array(value_typecode)
+        for key, value in pairs:
+            if keys and keys[-1] == key:
+                values[-1] = value
+            else:
+                keys.append(key)
+                values.append(value)
+        return cls(keys, values)
+
+    @property
+    def key_array(self):
+        """The sorted key array, e.g. for persisting the mapping"""
+        return self._keys
+
+    @property
+    def value_array(self):
+        """The value array, parallel to key_array"""
+        return self._values
+
+    def _find(self, key):
+        keys = self._keys
+        position = bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            return position
+        return None
+
+    def __getitem__(self, key):
+        position = self._find(key)
+        if position is None:
+            raise KeyError(key)
+        return self._values[position]
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class SortedIntSet(Set):
+    """Read-only set of integers kept in one sorted array"""
+
+    def __init__(self, keys):
+        """
+        Initialize set
+
+        Args:
+            keys: Sorted sequence of unique integers (e.g., array('q'))
+        """
+        self._keys = keys
+
+    def __contains__(self, key):
+        keys = self._keys
+        position = bisect_left(keys, key)
+        return position < len(keys) and keys[position] == key
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class GeoTypeIndex(Mapping):
+    """
+    Read-only mapping of geonameids to place model classes
+
+    Stores a small integer type code per id in a compact mapping and
+    translates it back to the model class on lookup.
+    """
+
+    def __init__(self, codes, types):
+        """
+        Initialize index
+
+        Args:
+            codes: Mapping of geonameid -> type code (e.g., SortedIntMap)
+            types: Sequence of model classes, indexed by type code
+        """
+        self.codes = codes
+        self.types = tuple(types)
+
+    def __getitem__(self, key):
+        return self.types[self.codes[key]]
+
+    def __contains__(self, key):
+        return key in self.codes
+
+    def __iter__(self):
+        return iter(self.codes)
+
+    def __len__(self):
+        return len(self.codes)
@@ -0,0 +1,77 @@
+"""Disk-backed index for lookups that do not fit the memory budget"""
+
+import os
+import sqlite3
+from collections.abc import Mapping
+from itertools import islice
+
+# Rows written per executemany() call while filling an index
+DISK_INDEX_BATCH_SIZE = 10000
+
+
+class DiskIndex(Mapping):
+    """
+    Read-only mapping stored in an SQLite file
+
+    Keys may be integers or strings; values are anything SQLite stores
+    natively (integers, strings or None). Filling it streams (key, value)
+    pairs to disk in batches, so building a large index costs a batch of
+    memory, and each lookup is one primary key search.
+    """
+
+    def __init__(self, filepath):
+        """
+        Create an empty index, replacing any previous file at filepath
+
+        Args:
+            filepath: Path of the SQLite file
+        """
+        self.filepath = filepath
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+        self._connection = sqlite3.connect(filepath)
+        # The file is scratch space rebuilt on every run, so durability is
+        # not needed
+        self._connection.execute("PRAGMA journal_mode = OFF")
+        self._connection.execute("PRAGMA synchronous = OFF")
+        # No declared column types, so 1 and '1' stay distinct keys
+        self._connection.execute("CREATE TABLE idx (key PRIMARY KEY, value) WITHOUT ROWID")
+
+    def update(self, pairs):
+        """
+        Add (key, value) pairs; a later pair replaces an earlier one
+
+        Args:
+            pairs: Iterable of (key, value) tuples
+        """
+        pairs = iter(pairs)
+        with self._connection:
+            while True:
+                batch = list(islice(pairs, DISK_INDEX_BATCH_SIZE))
+                if not batch:
+                    break
+                self._connection.executemany("INSERT OR REPLACE INTO idx (key, value) VALUES (?, ?)", batch)
+
+    def close(self):
+        """Close the index and remove its file"""
+        self._connection.close()
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+
+    def __getitem__(self, key):
+        row = self._connection.execute("SELECT value FROM idx WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def __contains__(self, key):
+        return self._connection.execute("SELECT 1 FROM idx WHERE key = ?", (key,)).fetchone() is not None
+
+    def __iter__(self):
+        for (key,) in self._connection.execute("SELECT key FROM idx ORDER BY key"):
+            yield key
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM idx").fetchone()[0]
@@ -49,7 +49,7 @@ class Downloader:
 
     def _download_file(self, filekey, filename):
         """Download a single file"""
-        filepath = os.path.join(self.data_dir, filename)
+        filepath = self._get_filepath(filekey, filename)
 
         # Skip download if file exists and not forcing
         if not self.force and os.path.exists(filepath):
@@ -60,11 +60,15 @@ class Downloader:
         web_file = self._fetch_from_urls(filekey, filename)
 
         if web_file is not None:
-            self._save_file(filename, web_file)
+            self._save_file(filepath, web_file)
         elif not os.path.exists(filepath):
             urls = [e.format(filename=filename) for e in settings.files[filekey]["urls"]]
             raise DownloadError(f"File not found and download failed: {filename} {urls}")
 
+    def _get_filepath(self, filekey, filename):
+        """Local path for a file, inside the filekey's subdirectory if it has one"""
+        return os.path.join(self.data_dir, settings.files[filekey].get("subdir", ""), filename)
+
     def _fetch_from_urls(self, filekey, filename):
         """Attempt to fetch file from list of URLs"""
         urls = [e.format(filename=filename) for e in settings.files[filekey]["urls"]]
@@ -88,14 +92,15 @@ class Downloader:
         self.logger.error("Web file not found: %s. Tried URLs:\n%s", filename, "\n".join(urls))
         return None
 
-    def _save_file(self, filename, web_file):
+    def _save_file(self, filepath, web_file):
         """Save downloaded file to disk with streaming and size limits"""
-        filepath = os.path.join(self.data_dir, filename)
+        filename = os.path.basename(filepath)
+        file_dir = os.path.dirname(filepath)
 
         # Create directory if needed
-        if not os.path.exists(self.data_dir):
-            os.makedirs(self.data_dir)
-            self.logger.debug("Created directory: %s", self.data_dir)
+        if not os.path.exists(file_dir):
+            os.makedirs(file_dir)
+            self.logger.debug("Created directory: %s", file_dir)
 
         # Stream file to disk with size checking
         # This prevents memory exhaustion and DoS attacks
@@ -0,0 +1,209 @@
+"""Set-based deletion of imported data"""
+
+import logging
+import os
+from collections import Counter
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models
+
+from ..models import SET_NULL_OR_CASCADE
+
+LOGGER_NAME = os.environ.get("TRAVIS_LOGGER_NAME", "cities")
+
+
+class Flusher:
+    """
+    Deletes querysets without Django's deletion collector
+
+    QuerySet.delete() loads every related object the deletion cascades to
+    into memory and nulls foreign keys object by object. Flusher follows the
+    same on_delete rules with one statement per relation instead: dependent
+    rows are deleted or have their foreign key set to NULL with set-based
+    UPDATE and DELETE statements, children before parents, and many-to-many
+    rows are deleted from the through tables directly.
+
+    No pre_delete or post_delete signals are sent.
+    """
+
+    # on_delete handlers followed with set-based statements
+    SUPPORTED_ON_DELETE = (SET_NULL_OR_CASCADE, models.CASCADE, models.SET_NULL, models.DO_NOTHING)
+
+    def __init__(self, using="default"):
+        """
+        Initialize flusher
+
+        Args:
+            using: Database alias to delete from
+        """
+        self.using = using
+        self.logger = logging.getLogger(LOGGER_NAME)
+
+    @classmethod
+    def can_flush(cls, model, seen=None):
+        """
+        Return whether every relation a deletion of model reaches is supported
+
+        Args:
+            model: Model class to delete from
+
+        Returns:
+            bool: False if some relation needs Django's collector (e.g. PROTECT)
+        """
+        seen = set() if seen is None else seen
+        if model in seen:
+            return True
+        seen.add(model)
+
+        for relation in model._meta.related_objects:
+            if relation.many_to_many:
+                continue
+            if relation.on_delete not in cls.SUPPORTED_ON_DELETE:
+                return False
+            if cls._cascades(relation) and not cls.can_flush(relation.related_model, seen):
+                return False
+        return True
+
+    @staticmethod
+    def _cascades(relation):
+        if relation.on_delete is SET_NULL_OR_CASCADE:
+            return not relation.field.null
+        return relation.on_delete is models.CASCADE
+
+    def delete(self, queryset):
+        """
+        Delete the rows of a queryset and what depends on them
+
+        Args:
+            queryset: Rows to delete
+
+        Returns:
+            tuple: (deleted, nulled) Counters of row counts by model label
+        """
+        deleted = Counter()
+        nulled = Counter()
+        self._delete(queryset.using(self.using).order_by(), deleted, nulled)
+
+        for label, count in nulled.items():
+            self.logger.info("Unlinked %d %s rows", count, label)
+        for label, count in deleted.items():
+            self.logger.info("Deleted %d %s rows", count, label)
+
+        return deleted, nulled
+
+    def _delete(self, queryset, deleted, nulled):
+        model = queryset.model
+        pks = queryset.values("pk")
+
+        # Many-to-many rows of the model's own fields and of fields pointing to it
+        for field in model._meta.many_to_many:
+            self._delete_through(field.remote_field.through, field.m2m_field_name(), pks, deleted)
+        for relation in model._meta.related_objects:
+            if relation.many_to_many:
+                field = relation.field
+                self._delete_through(field.remote_field.through, field.m2m_reverse_field_name(), pks, deleted)
+
+        # Rows with foreign keys to the model
+        for relation in model._meta.related_objects:
+            if relation.many_to_many or relation.on_delete is models.DO_NOTHING:
+                continue
+            related = relation.related_model._base_manager.using(self.using).filter(
+                **{relation.field.name + "__in": pks}
+            )
+            if self._cascades(relation):
+                self._delete(related, deleted, nulled)
+            else:
+                nulled[relation.related_model._meta.label] += related.update(**{relation.field.name: None})
+
+        deleted[model._meta.label] += self.delete_rows(queryset)
+
+    def _delete_through(self, through, field_name, pks, deleted):
+        rows = through._base_manager.using(self.using).filter(**{field_name + "__in": pks})
+        deleted[through._meta.label] += self.delete_rows(rows)
+
+    def delete_rows(self, queryset):
+        """
+        Delete the rows of a queryset with a single DELETE statement
+
+        Unlike QuerySet.delete(), nothing that references the rows is
+        followed and no signals are sent, so the caller must have dealt with
+        the referencing rows first.
+
+        Args:
+            queryset: Rows to delete
+
+        Returns:
+            int: Number of rows deleted
+        """
+        connection = connections[self.using]
+        model = queryset.model
+        try:
+            sql, params = queryset.order_by().values("pk").query.get_compiler(self.using).as_sql()
+        except EmptyResultSet:
+            return 0
+
+        # Selecting from a derived table lets MySQL delete from a table the
+        # subquery reads
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {} WHERE {} IN (SELECT * FROM ({}) flushed)".format(
+                    connection.ops.quote_name(model._meta.db_table),
+                    connection.ops.quote_name(model._meta.pk.column),
+                    sql,
+                ),
+                params,
+            )
+            return cursor.rowcount
+
+    def truncate(self, model):
+        """
+        Empty a model's table with TRUNCATE ... CASCADE (PostgreSQL only)
+
+        TRUNCATE does not follow on_delete: every table with a foreign key to
+        the model is emptied too, even where a deletion would only set the
+        key to NULL. Check can_truncate() first.
+
+        Args:
+            model: Model class whose table to empty
+        """
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            cursor.execute("TRUNCATE TABLE {} CASCADE".format(connection.ops.quote_name(model._meta.db_table)))
+        self.logger.info("Truncated %s", model._meta.label)
+
+    def can_truncate(self, model, flushed_models=()):
+        """
+        Return whether TRUNCATE ... CASCADE empties no more than deleting every row would
+
+        TRUNCATE empties the tables with foreign keys to the model, and the
+        tables referencing those in turn. Deleting every row empties them too
+        where the keys cascade; a table the deletion would only unlink is
+        fine if it is flushed as a whole as well.
+
+        Args:
+            model: Model class whose table to empty
+            flushed_models: Model classes whose tables the same flush empties
+
+        Returns:
+            bool: False if the database is not PostgreSQL or TRUNCATE would
+            empty a table that is not being flushed
+        """
+        if connections[self.using].vendor != "postgresql":
+            return False
+        return self._truncates_cleanly(model, set(flushed_models), set())
+
+    @classmethod
+    def _truncates_cleanly(cls, model, flushed_models, seen):
+        if model in seen:
+            return True
+        seen.add(model)
+
+        # Many-to-many rows go either way, so only foreign keys matter
+        for relation in model._meta.related_objects:
+            if relation.many_to_many:
+                continue
+            if not cls._cascades(relation) and relation.related_model not in flushed_models:
+                return False
+            if not cls._truncates_cleanly(relation.related_model, flushed_models, seen):
+                return False
+        return True
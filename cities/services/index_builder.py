@@ -1,19 +1,34 @@
 """Index building service for fast lookups during import"""
 
+import hashlib
 import logging
 import os
 import re
+import tempfile
+from array import array
 from itertools import chain
 
 from swapper import load_model
 from tqdm import tqdm
 
+from ..conf import country_lookups, settings
 from ..models import District, Region, Subregion
+from .compact_index import GeoTypeIndex, SortedIntMap, SortedIntSet
+from .disk_index import DiskIndex
+from .index_cache import IndexCache, file_fingerprint, table_fingerprint
 from .parser import Parser
+from .spatial_index import NearestPointIndex
 
 # Database iterator chunk size for memory-efficient querying
 DB_ITERATOR_CHUNK_SIZE = 1000
 
+# Approximate peak memory per entry while building each index, checked
+# against CITIES_INDEX_MEMORY_LIMIT
+REGION_ID_INDEX_ENTRY_BYTES = 200  # dict slot, key string and id
+CITY_ID_INDEX_ENTRY_BYTES = 8  # one array slot
+GEO_ID_INDEX_ENTRY_BYTES = 17  # per-type run plus merged key and type code
+HIERARCHY_INDEX_ENTRY_BYTES = 80  # pair arrays, sort order list and output
+
 # Load swappable models
 Continent = load_model("cities", "Continent")
 Country = load_model("cities", "Country")
@@ -30,12 +45,62 @@ class IndexBuilder:
         Initialize index builder
 
         Args:
-            data_dir: Directory containing data files (for hierarchy)
+            data_dir: Directory containing data files (for hierarchy and,
+                with CITIES_INDEX_CACHE, the index cache)
             quiet: If True, disable progress bars
         """
         self.data_dir = data_dir
         self.quiet = quiet
         self.logger = logging.getLogger(LOGGER_NAME)
+        self.cache = None
+        if settings.index_cache and data_dir:
+            self.cache = IndexCache(os.path.join(data_dir, "index_cache"))
+        self.disk_indices = []
+        self.spill_dir = None
+
+    def get_entry_limit(self, bytes_per_entry):
+        """
+        Return how many entries of an index fit CITIES_INDEX_MEMORY_LIMIT
+
+        Args:
+            bytes_per_entry: Approximate memory per index entry
+
+        Returns:
+            int: Maximum number of entries, or None if there is no limit
+        """
+        if not settings.index_memory_limit:
+            return None
+        return settings.index_memory_limit // bytes_per_entry
+
+    def create_disk_index(self, name):
+        """
+        Create an empty disk-backed index, removed again by close()
+
+        Args:
+            name: Index name, used for the file name
+
+        Returns:
+            DiskIndex
+        """
+        self.logger.info("Index %s exceeds CITIES_INDEX_MEMORY_LIMIT, building it on disk", name)
+        if self.data_dir:
+            directory = os.path.join(self.data_dir, "index_spill")
+        else:
+            if self.spill_dir is None:
+                self.spill_dir = tempfile.TemporaryDirectory(prefix="cities_index_")
+            directory = self.spill_dir.name
+        disk_index = DiskIndex(os.path.join(directory, "{}.sqlite".format(name)))
+        self.disk_indices.append(disk_index)
+        return disk_index
+
+    def close(self):
+        """Close and remove the disk-backed indices built so far, and their temporary directory"""
+        for disk_index in self.disk_indices:
+            disk_index.close()
+        self.disk_indices = []
+        if self.spill_dir is not None:
+            self.spill_dir.cleanup()
+            self.spill_dir = None
 
     @staticmethod
     def build_continent_index(quiet=False):
@@ -97,6 +162,84 @@ class IndexBuilder:
 
         return region_index
 
+    def build_region_id_index(self, quiet=False):
+        """
+        Build region full_code -> Region/Subregion id index
+
+        Lighter variant of build_region_index() for importers that only set
+        foreign keys: no model instances are created.
+
+        Returns:
+            Mapping: {full_code: id}, a DiskIndex if it exceeds the memory limit
+        """
+        regions_qs = Region.objects.values_list("country__code", "code", "id")
+        subregions_qs = Subregion.objects.values_list("region__country__code", "region__code", "code", "id")
+        total = regions_qs.count() + subregions_qs.count()
+
+        entry_limit = self.get_entry_limit(REGION_ID_INDEX_ENTRY_BYTES)
+        if entry_limit is not None and total > entry_limit:
+            region_index = self.create_disk_index("region_ids")
+            region_index.update(
+                (".".join(row[:-1]), row[-1])
+                for row in tqdm(
+                    chain(
+                        regions_qs.iterator(chunk_size=DB_ITERATOR_CHUNK_SIZE),
+                        subregions_qs.iterator(chunk_size=DB_ITERATOR_CHUNK_SIZE),
+                    ),
+                    disable=quiet,
+                    total=total,
+                    desc="Building region index",
+                )
+            )
+            return region_index
+
+        fingerprint = None
+        if self.cache:
+            fingerprint = table_fingerprint(Country.objects.all(), Region.objects.all(), Subregion.objects.all())
+            cached = self.cache.load("region_ids", fingerprint)
+            if cached:
+                return cached[1]
+
+        region_index = {}
+        for row in tqdm(
+            chain(
+                regions_qs.iterator(chunk_size=DB_ITERATOR_CHUNK_SIZE),
+                subregions_qs.iterator(chunk_size=DB_ITERATOR_CHUNK_SIZE),
+            ),
+            disable=quiet,
+            total=total,
+            desc="Building region index",
+        ):
+            region_index[".".join(row[:-1])] = row[-1]
+
+        if self.cache:
+            self.cache.save("region_ids", fingerprint, data=region_index)
+
+        return region_index
+
+    @staticmethod
+    def build_subregion_name_index(quiet=False):
+        """
+        Build (region_id, name) -> Subregion ids indices, by name and name_std
+
+        Returns:
+            dict: {"name": {(region_id, name): [id, ...]},
+            "name_std": {(region_id, name_std): [id, ...]}}
+        """
+        subregion_name_index = {"name": {}, "name_std": {}}
+        subregions_qs = Subregion.objects.values_list("id", "region_id", "name", "name_std")
+
+        for subregion_id, region_id, name, name_std in tqdm(
+            subregions_qs.iterator(chunk_size=DB_ITERATOR_CHUNK_SIZE),
+            disable=quiet,
+            total=subregions_qs.count(),
+            desc="Building subregion name index",
+        ):
+            subregion_name_index["name"].setdefault((region_id, name), []).append(subregion_id)
+            subregion_name_index["name_std"].setdefault((region_id, name_std), []).append(subregion_id)
+
+        return subregion_name_index
+
     @staticmethod
     def build_city_index(quiet=False):
         """
@@ -119,45 +262,181 @@ class IndexBuilder:
 
         return city_index
 
-    def build_hierarchy_index(self):
+    def build_city_id_index(self, quiet=False):
+        """
+        Build the set of existing city ids
+
+        Lighter variant of build_city_index() for importers that only set
+        foreign keys: ids are kept in one sorted array and no model instances
+        are created.
+
+        Returns:
+            Set: {id}, a DiskIndex if it exceeds the memory limit
+        """
+        cities_qs = City.objects.order_by("id").values_list("id", flat=True)
+        total = cities_qs.count()
+
+        entry_limit = self.get_entry_limit(CITY_ID_INDEX_ENTRY_BYTES)
+        if entry_limit is not None and total > entry_limit:
+            city_index = self.create_disk_index("city_ids")
+            city_index.update(
+                (city_id, None)
+                for city_id in tqdm(
+                    cities_qs.iterator(chunk_size=DB_ITERATOR_CHUNK_SIZE),
+                    disable=quiet,
+                    total=total,
+                    desc="Building city index",
+                )
+            )
+            return city_index
+
+        fingerprint = None
+        if self.cache:
+            fingerprint = table_fingerprint(City.objects.all())
+            cached = self.cache.load("city_ids", fingerprint)
+            if cached:
+                return SortedIntSet(cached[0]["ids"])
+
+        ids = array(
+            "q",
+            tqdm(
+                cities_qs.iterator(chunk_size=DB_ITERATOR_CHUNK_SIZE),
+                disable=quiet,
+                total=total,
+                desc="Building city index",
+            ),
+        )
+
+        if self.cache:
+            self.cache.save("city_ids", fingerprint, arrays={"ids": ids})
+
+        return SortedIntSet(ids)
+
+    @staticmethod
+    def build_city_location_index(quiet=False, min_population=None):
+        """
+        Build a nearest city index over city locations
+
+        Args:
+            quiet: If True, disable progress bars
+            min_population: Optional minimum population of indexed cities
+
+        Returns:
+            NearestPointIndex: City ids by location
+        """
+        cities_qs = City.objects.all()
+        if min_population is not None:
+            cities_qs = cities_qs.filter(population__gt=min_population)
+        cities_qs = cities_qs.values_list("id", "location")
+
+        city_location_index = NearestPointIndex()
+        for city_id, location in tqdm(
+            cities_qs.iterator(chunk_size=DB_ITERATOR_CHUNK_SIZE),
+            disable=quiet,
+            total=cities_qs.count(),
+            desc="Building city location index",
+        ):
+            if location is not None:
+                city_location_index.add(city_id, location.x, location.y)
+
+        return city_location_index
+
+    def build_hierarchy_index(self, types=None, children=None):
         """
-        Build hierarchy parent-child index from hierarchy file
+        Build hierarchy child -> parent index from hierarchy file
+
+        Rows are streamed from the file and filtered as they are read, so only
+        the kept (child, parent) pairs are held in memory, in compact sorted
+        arrays. When a child has several kept rows the last one wins. If the
+        kept pairs outgrow the memory limit, the index moves to disk.
+
+        Args:
+            types: Optional collection of hierarchy types (the file's type
+                column, e.g. 'ADM' or '') to keep
+            children: Optional collection of child ids to keep
 
         Returns:
-            dict: {child_id: parent_id}
+            Mapping: {child_id: parent_id}, a SortedIntMap or a DiskIndex
         """
         if not self.data_dir:
             raise ValueError("data_dir required for building hierarchy index")
 
         parser = Parser(self.data_dir)
-        # Load data once into memory to avoid double file parsing
-        data = list(parser.get_data("hierarchy"))
-        total = len(data)
-
-        hierarchy = {}
-        for item in tqdm(
-            data,
-            disable=self.quiet,
-            total=total,
-            desc="Building hierarchy index",
-        ):
-            parent_id = int(item["parent"])
-            child_id = int(item["child"])
-            hierarchy[child_id] = parent_id
+        if types is not None:
+            types = frozenset(types)
+        if children is not None and not isinstance(children, (set, frozenset, SortedIntSet)):
+            children = frozenset(children)
+
+        fingerprint = None
+        if self.cache:
+            fingerprint = {
+                "files": file_fingerprint(
+                    *[parser.get_filepath("hierarchy", filename) for filename in parser.get_filenames("hierarchy")]
+                ),
+                "types": sorted(types) if types is not None else None,
+                "children": (
+                    hashlib.sha1(array("q", sorted(children)).tobytes()).hexdigest() if children is not None else None
+                ),
+            }
+            cached = self.cache.load("hierarchy", fingerprint)
+            if cached:
+                arrays = cached[0]
+                return SortedIntMap(arrays["children"], arrays["parents"])
+
+        def pairs():
+            for item in tqdm(parser.get_data("hierarchy"), disable=self.quiet, desc="Building hierarchy index"):
+                if types is not None and item.get("type", "") not in types:
+                    continue
+                child_id = int(item["child"])
+                if children is not None and child_id not in children:
+                    continue
+                yield child_id, int(item["parent"])
+
+        entry_limit = self.get_entry_limit(HIERARCHY_INDEX_ENTRY_BYTES)
+        rows = pairs()
+        children_ids = array("q")
+        parent_ids = array("q")
+        for child_id, parent_id in rows:
+            if entry_limit is not None and len(children_ids) >= entry_limit:
+                hierarchy = self.create_disk_index("hierarchy")
+                hierarchy.update(chain(zip(children_ids, parent_ids), [(child_id, parent_id)], rows))
+                return hierarchy
+            children_ids.append(child_id)
+            parent_ids.append(parent_id)
+
+        hierarchy = SortedIntMap.from_arrays(children_ids, parent_ids)
+        del children_ids, parent_ids
+
+        if self.cache:
+            self.cache.save(
+                "hierarchy",
+                fingerprint,
+                arrays={"children": hierarchy.key_array, "parents": hierarchy.value_array},
+            )
 
         return hierarchy
 
     @staticmethod
-    def build_geo_index(quiet=False):
+    def build_geo_index(quiet=False, countries=None):
         """
         Build comprehensive geoname_id -> object index for all geographic types
 
+        Args:
+            quiet: If True, disable progress bars
+            countries: Optional set of country codes to restrict the index to
+
         Returns:
             dict: {geoname_id: {"type": Model, "object": instance}}
         """
         geo_index = {}
 
-        for type_ in (Country, Region, Subregion, City, District):
+        for import_type, type_ in (
+            ("country", Country),
+            ("region", Region),
+            ("subregion", Subregion),
+            ("city", City),
+            ("district", District),
+        ):
             plural_type_name = (
                 "{}s".format(type_.__name__) if type_.__name__[-1] != "y" else "{}ies".format(type_.__name__[:-1])
             )
@@ -165,6 +444,8 @@ class IndexBuilder:
             # Fetch queryset once and calculate count efficiently
             # Use select_related to prefetch foreign keys that will be accessed
             qs = type_.objects.all()
+            if countries:
+                qs = qs.filter(**{country_lookups[import_type] + "__in": countries})
             if type_ == Region:
                 qs = qs.select_related("country")
             elif type_ == Subregion:
@@ -188,6 +469,80 @@ class IndexBuilder:
 
         return geo_index
 
+    def build_geo_id_index(self, quiet=False, countries=None):
+        """
+        Build compact geoname_id -> model class index for all geographic types
+
+        Lighter variant of build_geo_index(): ids are kept in a sorted array
+        with a parallel array of one-byte type codes, and no model instances
+        are created.
+
+        Args:
+            quiet: If True, disable progress bars
+            countries: Optional set of country codes to restrict the index to
+
+        Returns:
+            GeoTypeIndex: Mapping of {geoname_id: Model}, looked up on disk if
+            it exceeds the memory limit
+        """
+        geo_types = (
+            ("country", Country),
+            ("region", Region),
+            ("subregion", Subregion),
+            ("city", City),
+            ("district", District),
+        )
+        types = [type_ for import_type, type_ in geo_types]
+
+        fingerprint = None
+        if self.cache:
+            fingerprint = {
+                "countries": sorted(countries or []),
+                "tables": table_fingerprint(*[type_.objects.all() for type_ in types]),
+            }
+            cached = self.cache.load("geo_ids", fingerprint)
+            if cached:
+                arrays = cached[0]
+                return GeoTypeIndex(SortedIntMap(arrays["keys"], arrays["codes"]), types)
+
+        querysets = []
+        for import_type, type_ in geo_types:
+            qs = type_.objects.all()
+            if countries:
+                qs = qs.filter(**{country_lookups[import_type] + "__in": countries})
+            querysets.append(qs.order_by("id").values_list("id", flat=True))
+        totals = [qs.count() for qs in querysets]
+
+        def iter_ids(position):
+            type_ = types[position]
+            plural_type_name = (
+                "{}s".format(type_.__name__) if type_.__name__[-1] != "y" else "{}ies".format(type_.__name__[:-1])
+            )
+            return tqdm(
+                querysets[position].iterator(chunk_size=DB_ITERATOR_CHUNK_SIZE),
+                disable=quiet,
+                total=totals[position],
+                desc="Building geo index for {}".format(plural_type_name.lower()),
+            )
+
+        entry_limit = self.get_entry_limit(GEO_ID_INDEX_ENTRY_BYTES)
+        if entry_limit is not None and sum(totals) > entry_limit:
+            # Later types replace earlier ones on duplicate ids, as below
+            codes = self.create_disk_index("geo_ids")
+            for position in range(len(types)):
+                codes.update((geo_id, position) for geo_id in iter_ids(position))
+            return GeoTypeIndex(codes, types)
+
+        runs = [(array("q", iter_ids(position)), position) for position in range(len(types))]
+
+        # Later types win on duplicate ids, as they did in build_geo_index()
+        codes = SortedIntMap.merge(runs, value_typecode="b")
+
+        if self.cache:
+            self.cache.save("geo_ids", fingerprint, arrays={"keys": codes.key_array, "codes": codes.value_array})
+
+        return GeoTypeIndex(codes, types)
+
     def build_postal_code_regex_index(self, country_index, quiet=False):
         """
         Build postal code regex index from country data
@@ -0,0 +1,175 @@
+"""On-disk cache for built indices, reused across import runs"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+from django.db.models import Count, Max
+
+LOGGER_NAME = os.environ.get("TRAVIS_LOGGER_NAME", "cities")
+
+# File layout: magic, header length, JSON header, then each array's raw bytes
+# starting on an 8-byte boundary so it can be cast straight from the mmap
+CACHE_MAGIC = b"CITIDX1\n"
+CACHE_HEADER_LENGTH = struct.Struct("<Q")
+CACHE_ALIGNMENT = 8
+
+
+def table_fingerprint(*querysets):
+    """
+    Fingerprint tables by row count and max id
+
+    Args:
+        *querysets: Querysets (or managers) the index is built from
+
+    Returns:
+        list: [[model label, count, max id], ...]
+    """
+    fingerprint = []
+    for qs in querysets:
+        stats = qs.aggregate(count=Count("id"), max_id=Max("id"))
+        fingerprint.append([qs.model._meta.label, stats["count"], stats["max_id"]])
+    return fingerprint
+
+
+def file_fingerprint(*filepaths):
+    """
+    Fingerprint source files by size and modification time
+
+    Args:
+        *filepaths: Paths of the files the index is built from
+
+    Returns:
+        list: [[filename, size, mtime in ns], ...]
+    """
+    fingerprint = []
+    for filepath in filepaths:
+        stat = os.stat(filepath)
+        fingerprint.append([os.path.basename(filepath), stat.st_size, stat.st_mtime_ns])
+    return fingerprint
+
+
+class IndexCache:
+    """
+    Persists integer arrays (and small JSON data) for built indices
+
+    Each index is one file in cache_dir. Its header records the fingerprint
+    of the data it was built from; a load with a different fingerprint is a
+    miss. Arrays are returned as read-only memoryviews over a memory map, so
+    opening a cached index costs no parsing and the pages are shared between
+    workers reading the same file.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Initialize cache
+
+        Args:
+            cache_dir: Directory to store cache files in
+        """
+        self.cache_dir = cache_dir
+        self.logger = logging.getLogger(LOGGER_NAME)
+
+    def get_filepath(self, name):
+        return os.path.join(self.cache_dir, "{}.idx".format(name))
+
+    def load(self, name, fingerprint):
+        """
+        Load a cached index
+
+        Args:
+            name: Index name
+            fingerprint: JSON-serializable fingerprint of the current source data
+
+        Returns:
+            tuple: ({array name: memoryview}, data), or None on a miss
+        """
+        filepath = self.get_filepath(name)
+        try:
+            with open(filepath, "rb") as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Missing or empty file
+            return None
+
+        try:
+            if buf[: len(CACHE_MAGIC)] != CACHE_MAGIC:
+                raise ValueError("bad magic")
+            offset = len(CACHE_MAGIC)
+            (header_length,) = CACHE_HEADER_LENGTH.unpack_from(buf, offset)
+            offset += CACHE_HEADER_LENGTH.size
+            header = json.loads(bytes(buf[offset : offset + header_length]).decode("utf-8"))
+        except (ValueError, struct.error) as e:
+            self.logger.warning("Ignoring unreadable index cache %s: %s", filepath, e)
+            buf.close()
+            return None
+
+        if header["fingerprint"] != json.loads(json.dumps(fingerprint)):
+            self.logger.debug("Index cache %s is stale", filepath)
+            buf.close()
+            return None
+
+        view = memoryview(buf)
+        arrays = {}
+        for array_name, (typecode, start, end) in header["arrays"].items():
+            arrays[array_name] = view[start:end].cast(typecode)
+
+        self.logger.debug("Loaded index cache %s", filepath)
+        return arrays, header["data"]
+
+    def save(self, name, fingerprint, arrays=None, data=None):
+        """
+        Save an index, replacing any previous version atomically
+
+        Args:
+            name: Index name
+            fingerprint: JSON-serializable fingerprint of the source data
+            arrays: Dict of {array name: array.array}
+            data: Optional JSON-serializable data stored in the header
+        """
+        arrays = arrays or {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Lay out the arrays after the header, which only depends on their
+        # sizes, so compute offsets relative to the data section first
+        layout = {}
+        position = 0
+        for array_name, values in arrays.items():
+            position = -(-position // CACHE_ALIGNMENT) * CACHE_ALIGNMENT
+            nbytes = len(values) * values.itemsize
+            layout[array_name] = [values.typecode, position, position + nbytes]
+            position += nbytes
+
+        def encode_header(data_start):
+            shifted = {k: [t, s + data_start, e + data_start] for k, (t, s, e) in layout.items()}
+            return json.dumps({"fingerprint": fingerprint, "arrays": shifted, "data": data}).encode("utf-8")
+
+        # The header's own length shifts the data start; settle on a fixed point
+        prefix_length = len(CACHE_MAGIC) + CACHE_HEADER_LENGTH.size
+        data_start = 0
+        while True:
+            header = encode_header(data_start)
+            aligned = -(-(prefix_length + len(header)) // CACHE_ALIGNMENT) * CACHE_ALIGNMENT
+            if aligned == data_start:
+                break
+            data_start = aligned
+
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".{}.".format(name))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(CACHE_MAGIC)
+                f.write(CACHE_HEADER_LENGTH.pack(len(header)))
+                f.write(header)
+                for array_name, values in arrays.items():
+                    f.write(b"\0" * (layout[array_name][1] + data_start - f.tell()))
+                    f.write(values.tobytes())
+            os.replace(temp_path, self.get_filepath(name))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self.logger.debug("Saved index cache %s", self.get_filepath(name))
@@ -0,0 +1,147 @@
+"""Database maintenance after large imports"""
+
+import logging
+import os
+import time
+
+from django.contrib.gis.db.models import GeometryField
+from django.db import connections
+
+LOGGER_NAME = os.environ.get("TRAVIS_LOGGER_NAME", "cities")
+
+# Maintenance tasks, in the order they run on each table
+MAINTENANCE_TASKS = ("cluster", "reindex", "analyze")
+
+
+class Maintenance:
+    """
+    Runs backend-appropriate maintenance on imported tables
+
+    Tasks:
+        cluster: Rewrite tables with a spatial index in its order
+            (PostgreSQL CLUSTER), so nearby places share pages
+        reindex: Rebuild the tables' indexes (PostgreSQL and SQLite REINDEX,
+            MySQL OPTIMIZE TABLE)
+        analyze: Refresh the planner statistics (ANALYZE, or MySQL ANALYZE
+            TABLE)
+
+    Clustering rebuilds a table's indexes too, so clustered tables are not
+    reindexed again.
+    """
+
+    def __init__(self, models, using="default"):
+        """
+        Initialize for a set of models
+
+        Args:
+            models: Model classes whose tables to maintain
+            using: Database alias
+        """
+        self.models = models
+        self.using = using
+        self.logger = logging.getLogger(LOGGER_NAME)
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def run(self, tasks):
+        """
+        Run maintenance tasks on every table
+
+        Args:
+            tasks: Iterable of task names from MAINTENANCE_TASKS
+
+        Returns:
+            list: (task, table, seconds) for each statement run
+        """
+        unknown = set(tasks) - set(MAINTENANCE_TASKS)
+        if unknown:
+            raise ValueError("Unknown maintenance tasks: {}".format(", ".join(sorted(unknown))))
+
+        vendor = self.connection.vendor
+        if vendor not in ("postgresql", "mysql", "sqlite"):
+            self.logger.warning("Maintenance is not supported on %s, skipping it", vendor)
+            return []
+
+        timings = []
+        for model in self.models:
+            table = model._meta.db_table
+            clustered = False
+            for task in MAINTENANCE_TASKS:
+                if task not in tasks or (task == "reindex" and clustered):
+                    continue
+                sql = self._get_sql(task, model)
+                if sql is None:
+                    continue
+
+                start = time.perf_counter()
+                with self.connection.cursor() as cursor:
+                    cursor.execute(sql)
+                    if vendor == "mysql":
+                        # ANALYZE and OPTIMIZE TABLE return a result set
+                        cursor.fetchall()
+                seconds = time.perf_counter() - start
+
+                clustered = clustered or task == "cluster"
+                timings.append((task, table, seconds))
+                self.logger.info("%s %s took %.1fs", task.upper(), table, seconds)
+
+        return timings
+
+    def _get_sql(self, task, model):
+        """
+        Return the statement for a task on a model's table
+
+        Returns:
+            str: SQL, or None if the task does not apply
+        """
+        vendor = self.connection.vendor
+        table = self.connection.ops.quote_name(model._meta.db_table)
+
+        if task == "cluster":
+            if vendor != "postgresql":
+                return None
+            index = self._get_spatial_index(model)
+            if index is None:
+                return None
+            return "CLUSTER {} USING {}".format(table, self.connection.ops.quote_name(index))
+
+        if task == "reindex":
+            if vendor == "mysql":
+                return "OPTIMIZE TABLE {}".format(table)
+            return "REINDEX TABLE {}".format(table) if vendor == "postgresql" else "REINDEX {}".format(table)
+
+        if vendor == "mysql":
+            return "ANALYZE TABLE {}".format(table)
+        return "ANALYZE {}".format(table)
+
+    def _get_spatial_index(self, model):
+        """
+        Return the name of the GiST index on a model's spatially indexed geometry
+
+        Returns:
+            str: Index name, or None if the model has none
+        """
+        columns = [
+            field.column
+            for field in model._meta.local_concrete_fields
+            if isinstance(field, GeometryField) and field.spatial_index
+        ]
+        if not columns:
+            return None
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT i.relname
+                FROM pg_index x
+                JOIN pg_class i ON i.oid = x.indexrelid
+                JOIN pg_am am ON am.oid = i.relam
+                JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = x.indkey[0]
+                WHERE x.indrelid = %s::regclass AND am.amname = 'gist' AND x.indnatts = 1 AND a.attname = %s
+                """,
+                [self.connection.ops.quote_name(model._meta.db_table), columns[0]],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
@@ -2,10 +2,20 @@
 
 import io
 import os
+import shutil
+import tempfile
 import zipfile
+from contextlib import contextmanager
+from urllib.parse import quote
 
 from ..conf import settings
 
+# Bytes buffered per segment before they are appended to its file
+SEGMENT_BUFFER_SIZE = 1024 * 1024
+
+# Bumped when segment file names change, so older segments are rebuilt
+SEGMENT_VERSION = 2
+
 
 class Parser:
     """Parses GeoNames data files into dictionaries"""
@@ -19,41 +29,190 @@ class Parser:
         """
         self.data_dir = data_dir
 
-    def get_data(self, filekey):
+    def get_data(self, filekey, field=None, values=None):
         """
         Parse files for the given filekey into dictionaries
 
+        With field and values, only rows whose field is one of values are
+        returned. Rows are then filtered on their raw bytes, so the rows that
+        are skipped are never decoded or split into dictionaries.
+
         Args:
             filekey: Key from settings.files dict (e.g., 'country', 'city')
+            field: Optional field to filter rows on
+            values: Values of field to keep
+
+        Yields:
+            dict: Parsed row with field names as keys
+        """
+        for filename in self.get_filenames(filekey):
+            if field is None:
+                yield from self._parse_file(filekey, filename)
+            else:
+                yield from self._parse_filtered_file(filekey, filename, field, values)
+
+    def get_segmented_data(self, filekey, field, values):
+        """
+        Parse the rows of a filekey whose field is one of values, from segments
+
+        The first call splits each file into one segment file per value of
+        field, cached under data_dir; later calls only read the segments of
+        the requested values. A file's segments are rebuilt when its size or
+        modification time changes.
+
+        Args:
+            filekey: Key from settings.files dict (e.g., 'alt_name')
+            field: Field the files are segmented by
+            values: Values of field to keep
 
         Yields:
             dict: Parsed row with field names as keys
         """
+        fields = settings.files[filekey]["fields"]
+        for filename in self.get_filenames(filekey):
+            segment_dir = self._get_segment_dir(filekey, filename, field)
+            for value in sorted(values):
+                segment_path = os.path.join(segment_dir, self._segment_filename(value))
+                if not os.path.exists(segment_path):
+                    continue
+                with io.open(segment_path, "r", encoding="utf-8") as file_obj:
+                    for row in file_obj:
+                        yield dict(zip(fields, row.rstrip("\r\n").split("\t")))
+
+    def get_filenames(self, filekey):
+        """Return the filenames configured for a filekey"""
         if "filename" in settings.files[filekey]:
-            filenames = [settings.files[filekey]["filename"]]
-        else:
-            filenames = settings.files[filekey]["filenames"]
+            return [settings.files[filekey]["filename"]]
+        return settings.files[filekey]["filenames"]
 
-        for filename in filenames:
-            yield from self._parse_file(filekey, filename)
+    def get_filepath(self, filekey, filename):
+        """Return the local path of one of a filekey's files"""
+        return os.path.join(self.data_dir, settings.files[filekey].get("subdir", ""), filename)
 
     def _parse_file(self, filekey, filename):
         """Parse a single file"""
         name, ext = filename.rsplit(".", 1)
+        filepath = self.get_filepath(filekey, filename)
 
         # Handle zip files
         if ext == "zip":
-            filepath = os.path.join(self.data_dir, filename)
             with zipfile.ZipFile(filepath) as zf:
                 with zf.open(name + ".txt", "r") as zip_member:
                     file_obj = io.TextIOWrapper(zip_member, encoding="utf-8")
                     yield from self._parse_lines(filekey, file_obj)
         else:
             # Handle plain text files
-            filepath = os.path.join(self.data_dir, filename)
             with io.open(filepath, "r", encoding="utf-8") as file_obj:
                 yield from self._parse_lines(filekey, file_obj)
 
+    @contextmanager
+    def _open_binary(self, filekey, filename):
+        """Open one of a filekey's files, or its zipped text file, for reading bytes"""
+        name, ext = filename.rsplit(".", 1)
+        filepath = self.get_filepath(filekey, filename)
+        if ext == "zip":
+            with zipfile.ZipFile(filepath) as zf:
+                with zf.open(name + ".txt", "r") as zip_member:
+                    yield zip_member
+        else:
+            with io.open(filepath, "rb") as file_obj:
+                yield file_obj
+
+    def _iter_raw_rows(self, filekey, filename, field):
+        """
+        Yield (raw value of field, raw line) for each data line of a file
+
+        Args:
+            filekey: Key from settings.files dict
+            filename: One of the filekey's files
+            field: Field whose raw value is returned
+        """
+        position = settings.files[filekey]["fields"].index(field)
+        with self._open_binary(filekey, filename) as file_obj:
+            for row in file_obj:
+                # Skip comment lines
+                if row.startswith(b"#"):
+                    continue
+
+                columns = row.split(b"\t", position + 1)
+                value = columns[position].rstrip(b"\r\n") if len(columns) > position else b""
+                yield value, row
+
+    def _parse_filtered_file(self, filekey, filename, field, values):
+        """Parse the lines of a single file whose field is one of values"""
+        fields = settings.files[filekey]["fields"]
+        raw_values = set(e.encode("utf-8") for e in values)
+
+        for value, row in self._iter_raw_rows(filekey, filename, field):
+            if value in raw_values:
+                yield dict(zip(fields, row.decode("utf-8").rstrip("\r\n").split("\t")))
+
+    @staticmethod
+    def _segment_filename(value):
+        # Values are quoted, dots included, so none can name a path outside
+        # the segment directory. Quoting never leaves a bare "%", so rows
+        # without a value get a name no value can have.
+        return (quote(value, safe="").replace(".", "%2E") or "%") + ".txt"
+
+    def _get_segment_dir(self, filekey, filename, field):
+        """
+        Return the directory with a file's segments, splitting the file if needed
+
+        Args:
+            filekey: Key from settings.files dict
+            filename: One of the filekey's files
+            field: Field the file is segmented by
+
+        Returns:
+            str: Directory holding one "<quoted value>.txt" file per value of field
+        """
+        stat = os.stat(self.get_filepath(filekey, filename))
+        segments_root = os.path.join(self.data_dir, "segments", filekey, field)
+        prefix = filename.rsplit(".", 1)[0] + "-"
+        segment_dir = os.path.join(
+            segments_root, "{}{}-{}-v{}".format(prefix, stat.st_size, stat.st_mtime_ns, SEGMENT_VERSION)
+        )
+        if os.path.isdir(segment_dir):
+            return segment_dir
+
+        # Segments of earlier versions of the file are stale
+        if os.path.isdir(segments_root):
+            for entry in os.listdir(segments_root):
+                if entry.startswith(prefix):
+                    shutil.rmtree(os.path.join(segments_root, entry), ignore_errors=True)
+        os.makedirs(segments_root, exist_ok=True)
+
+        # Split into a temporary directory, so an interrupted split is never used
+        tmp_dir = tempfile.mkdtemp(prefix=prefix, dir=segments_root)
+        try:
+            buffers = {}
+            buffered = {}
+
+            def flush(raw_value):
+                segment_path = os.path.join(tmp_dir, self._segment_filename(raw_value.decode("utf-8")))
+                with io.open(segment_path, "ab") as segment:
+                    segment.writelines(buffers.pop(raw_value))
+                buffered[raw_value] = 0
+
+            for raw_value, row in self._iter_raw_rows(filekey, filename, field):
+                if not row.endswith(b"\n"):
+                    row += b"\n"
+                buffers.setdefault(raw_value, []).append(row)
+                buffered[raw_value] = buffered.get(raw_value, 0) + len(row)
+                # Segments are appended to in turn, so few files are open at once
+                if buffered[raw_value] >= SEGMENT_BUFFER_SIZE:
+                    flush(raw_value)
+
+            for raw_value in list(buffers):
+                flush(raw_value)
+
+            os.rename(tmp_dir, segment_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        return segment_dir
+
     def _parse_lines(self, filekey, file_obj):
         """Parse lines from file object"""
         fields = settings.files[filekey]["fields"]
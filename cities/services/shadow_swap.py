@@ -0,0 +1,190 @@
+"""Reimports into shadow tables that replace the live tables at the end"""
+
+import logging
+import os
+
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+
+LOGGER_NAME = os.environ.get("TRAVIS_LOGGER_NAME", "cities")
+
+# Schemas holding the tables being loaded and, during the swap, the old tables
+SHADOW_SCHEMA = "cities_shadow"
+OLD_SCHEMA = "cities_old"
+
+
+class ShadowTables:
+    """
+    Shadow copies of a set of tables, swapped in for the live tables (PostgreSQL)
+
+    On entry, the tables are created afresh in a separate schema, with the
+    names, indexes and constraints Django gives them, and that schema is put
+    first on the search_path of every connection to the database. Everything
+    the import writes therefore goes to the shadow tables, while other
+    clients keep reading the untouched live tables.
+
+    swap() then moves the live tables out and the shadow tables in with
+    schema changes in one short transaction, re-points foreign keys of other
+    tables at the new tables, and drops the old ones. Leaving the context
+    without swapping drops the shadow tables.
+    """
+
+    def __init__(self, models, using="default"):
+        """
+        Initialize for a set of models
+
+        Args:
+            models: Model classes (including through models) to shadow, each
+                after the models it has foreign keys to; every table with
+                foreign keys into the set should be in it too
+            using: Database alias
+        """
+        self.models = models
+        self.using = using
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.tables = [model._meta.db_table for model in models]
+        self.live_schema = None
+        self.search_path = None
+        self.swapped = False
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def _quote(self, *names):
+        return ".".join(self.connection.ops.quote_name(e) for e in names)
+
+    def _set_search_path(self, sender, connection, **kwargs):
+        """Put the shadow schema first on the search_path of a new connection"""
+        if connection.alias == self.using:
+            with connection.cursor() as cursor:
+                cursor.execute("SET search_path TO {}, {}".format(self._quote(SHADOW_SCHEMA), self.search_path))
+
+    def __enter__(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SHOW search_path")
+            self.search_path = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT n.nspname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE c.oid = %s::regclass",
+                [self._quote(self.tables[0])],
+            )
+            self.live_schema = cursor.fetchone()[0]
+
+            cursor.execute("DROP SCHEMA IF EXISTS {} CASCADE".format(self._quote(SHADOW_SCHEMA)))
+            cursor.execute("CREATE SCHEMA {}".format(self._quote(SHADOW_SCHEMA)))
+
+        # New connections, e.g. those of worker processes, write to the shadow
+        # tables too
+        connection_created.connect(self._set_search_path)
+        self._set_search_path(None, self.connection)
+
+        # Created unqualified, so in the first schema on the search_path
+        with self.connection.schema_editor() as schema_editor:
+            for model in self.models:
+                if not model._meta.auto_created:
+                    schema_editor.create_model(model)
+        self.logger.info("Created shadow tables for %s", ", ".join(self.tables))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        connection_created.disconnect(self._set_search_path)
+        with self.connection.cursor() as cursor:
+            cursor.execute("SET search_path TO {}".format(self.search_path))
+            if not self.swapped:
+                cursor.execute("DROP SCHEMA IF EXISTS {} CASCADE".format(self._quote(SHADOW_SCHEMA)))
+                self.logger.info("Dropped the shadow tables")
+        return False
+
+    def set_logged(self, logged):
+        """
+        Make the shadow tables logged or unlogged
+
+        Unlogged tables are not written to the WAL while they are loaded.
+        A logged table may not have a foreign key to an unlogged one, so the
+        tables are made logged from the referenced ones (models first, in
+        order, then through models) to the referencing ones, and unlogged in
+        the opposite order.
+
+        Args:
+            logged: True for LOGGED, False for UNLOGGED
+        """
+        persistence = "LOGGED" if logged else "UNLOGGED"
+        models = [model for model in self.models if not model._meta.auto_created]
+        models += [model for model in self.models if model._meta.auto_created]
+        if not logged:
+            models.reverse()
+
+        with self.connection.cursor() as cursor:
+            for model in models:
+                cursor.execute(
+                    "ALTER TABLE {} SET {}".format(self._quote(SHADOW_SCHEMA, model._meta.db_table), persistence)
+                )
+
+    def copy_live_data(self):
+        """Copy the rows of the live tables into the shadow tables"""
+        with self.connection.cursor() as cursor:
+            for model in self.models:
+                table = model._meta.db_table
+                columns = ", ".join(self._quote(field.column) for field in model._meta.local_concrete_fields)
+                cursor.execute(
+                    "INSERT INTO {} ({}) SELECT {} FROM {}".format(
+                        self._quote(SHADOW_SCHEMA, table), columns, columns, self._quote(self.live_schema, table)
+                    )
+                )
+                self.logger.info("Copied %d rows into the shadow %s table", cursor.rowcount, table)
+
+    def swap(self):
+        """
+        Replace the live tables with the shadow tables
+
+        Sequences are first moved past the loaded ids. Foreign keys of other
+        tables pointing into the set are re-created against the new tables
+        as NOT VALID within the swap, and validated after it, which does not
+        block their writers.
+        """
+        with self.connection.cursor() as cursor:
+            for sql in self.connection.ops.sequence_reset_sql(no_style(), self.models):
+                cursor.execute(sql)
+
+            live_tables = [self._quote(self.live_schema, table) for table in self.tables]
+            cursor.execute(
+                """
+                SELECT c.conrelid::regclass::text, c.conname, pg_get_constraintdef(c.oid)
+                FROM pg_constraint c
+                WHERE c.contype = 'f' AND c.confrelid = ANY(%s::regclass[])
+                AND NOT c.conrelid = ANY(%s::regclass[])
+                """,
+                [live_tables, live_tables],
+            )
+            external_keys = cursor.fetchall()
+
+        with transaction.atomic(using=self.using):
+            with self.connection.cursor() as cursor:
+                cursor.execute("CREATE SCHEMA {}".format(self._quote(OLD_SCHEMA)))
+                for source, target in ((self.live_schema, OLD_SCHEMA), (SHADOW_SCHEMA, self.live_schema)):
+                    for table in self.tables:
+                        cursor.execute(
+                            "ALTER TABLE {} SET SCHEMA {}".format(self._quote(source, table), self._quote(target))
+                        )
+
+                # The definitions name the referenced tables as the live
+                # tables were named, which now resolves to the new tables
+                cursor.execute("SET LOCAL search_path TO {}".format(self.search_path))
+                for table, name, definition in external_keys:
+                    cursor.execute("ALTER TABLE {} DROP CONSTRAINT {}".format(table, self._quote(name)))
+                    cursor.execute(
+                        "ALTER TABLE {} ADD CONSTRAINT {} {} NOT VALID".format(table, self._quote(name), definition)
+                    )
+
+                old_tables = ", ".join(self._quote(OLD_SCHEMA, table) for table in self.tables)
+                cursor.execute("DROP TABLE {}".format(old_tables))
+                cursor.execute("DROP SCHEMA {}".format(self._quote(OLD_SCHEMA)))
+                cursor.execute("DROP SCHEMA {}".format(self._quote(SHADOW_SCHEMA)))
+        self.swapped = True
+        self.logger.info("Swapped in the shadow tables")
+
+        with self.connection.cursor() as cursor:
+            for table, name, definition in external_keys:
+                cursor.execute("ALTER TABLE {} VALIDATE CONSTRAINT {}".format(table, self._quote(name)))
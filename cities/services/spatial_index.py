@@ -0,0 +1,138 @@
+"""In-memory nearest point search over geographic coordinates"""
+
+from array import array
+from math import asin, cos, inf, pi, radians, sin, sqrt
+
+from ..util import earth_radius_km
+
+# Grid cell edge, as a distance between points on the unit sphere (about 64 km
+# on the Earth's surface)
+DEFAULT_CELL_SIZE = 0.01
+
+
+def _unit_vector(lon, lat):
+    """Return the point on the unit sphere for a longitude and latitude"""
+    lon = radians(lon)
+    lat = radians(lat)
+    return cos(lat) * cos(lon), cos(lat) * sin(lon), sin(lat)
+
+
+def _shell(k):
+    """Yield the cell offsets at Chebyshev distance k from a cell"""
+    if k == 0:
+        yield 0, 0, 0
+        return
+    for dx in range(-k, k + 1):
+        for dy in range(-k, k + 1):
+            if abs(dx) == k or abs(dy) == k:
+                for dz in range(-k, k + 1):
+                    yield dx, dy, dz
+            else:
+                yield dx, dy, -k
+                yield dx, dy, k
+
+
+class NearestPointIndex:
+    """
+    Grid index of points on the Earth for nearest neighbour lookups
+
+    Points are stored as unit vectors and bucketed into cubic cells, so there
+    are no special cases at the poles or the antimeridian. The straight-line
+    (chord) distance between unit vectors orders points the same way as the
+    great circle distance, so the nearest point by chord is the nearest point
+    on the surface. A lookup searches shells of cells around the query until
+    no unsearched cell can hold a closer point.
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        """
+        Initialize an empty index
+
+        Args:
+            cell_size: Grid cell edge, as a chord length on the unit sphere
+        """
+        self.cell_size = cell_size
+        self.ids = array("q")
+        self.xs = array("d")
+        self.ys = array("d")
+        self.zs = array("d")
+        self.cells = {}
+
+    def _cell(self, x, y, z):
+        size = self.cell_size
+        return int(x // size), int(y // size), int(z // size)
+
+    def add(self, point_id, lon, lat):
+        """
+        Add a point
+
+        Args:
+            point_id: Integer id returned by nearest()
+            lon: Longitude in degrees
+            lat: Latitude in degrees
+        """
+        x, y, z = _unit_vector(lon, lat)
+        position = len(self.ids)
+        self.ids.append(point_id)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.zs.append(z)
+        self.cells.setdefault(self._cell(x, y, z), []).append(position)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nearest(self, lon, lat, max_distance_km=None):
+        """
+        Find the point nearest to a location
+
+        Args:
+            lon: Longitude in degrees
+            lat: Latitude in degrees
+            max_distance_km: Optional search radius in kilometers
+
+        Returns:
+            tuple: (point_id, distance in km), or None if no point is in range
+        """
+        if not self.ids:
+            return None
+
+        if max_distance_km is None:
+            max_chord = 2.0
+        else:
+            max_chord = 2 * sin(min(max_distance_km / earth_radius_km, pi) / 2)
+
+        qx, qy, qz = _unit_vector(lon, lat)
+        cx, cy, cz = self._cell(qx, qy, qz)
+        xs, ys, zs, cells = self.xs, self.ys, self.zs, self.cells
+        size = self.cell_size
+
+        best_position = None
+        best_chord2 = inf
+        # Cells further out than this only hold points beyond max_chord
+        max_shell = int(max_chord // size) + 1
+
+        for k in range(max_shell + 1):
+            for dx, dy, dz in _shell(k):
+                positions = cells.get((cx + dx, cy + dy, cz + dz))
+                if not positions:
+                    continue
+                for position in positions:
+                    ex = xs[position] - qx
+                    ey = ys[position] - qy
+                    ez = zs[position] - qz
+                    chord2 = ex * ex + ey * ey + ez * ez
+                    if chord2 < best_chord2:
+                        best_chord2 = chord2
+                        best_position = position
+
+            # Points in cells beyond shell k are more than k cells away
+            # along some axis, so their chord is longer than k * size
+            if best_position is not None and best_chord2 <= (k * size) ** 2:
+                break
+
+        if best_position is None or best_chord2 > max_chord * max_chord:
+            return None
+
+        chord = sqrt(best_chord2)
+        return self.ids[best_position], 2 * earth_radius_km * asin(min(chord / 2, 1.0))
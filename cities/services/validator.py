@@ -2,13 +2,25 @@
 
 import logging
 import os
-
-from django.contrib.gis.geos import Point
+from array import array
+from collections import namedtuple
 
 from ..exceptions import ValidationError
+from ..util import DeferredPoint
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 LOGGER_NAME = os.environ.get("TRAVIS_LOGGER_NAME", "cities")
 
+# Result of a batch (column) validator:
+#   values: parsed values (array.array, or a NumPy array when NumPy is used)
+#   rejected: one bool per row, True where the row failed validation
+#   reasons: {row position: error message} for the rejected rows
+ColumnResult = namedtuple("ColumnResult", ["values", "rejected", "reasons"])
+
 
 class Validator:
     """Centralizes validation logic for import data"""
@@ -93,9 +105,9 @@ class Validator:
                 msg = f"{entity_type}: {msg}"
             raise ValidationError(msg)
 
-    def parse_location(self, latitude, longitude, entity_type=None):
+    def parse_coordinates(self, latitude, longitude, entity_type=None):
         """
-        Parse and validate location coordinates
+        Parse and validate coordinates without building a geometry
 
         Args:
             latitude: Latitude value (string or number)
@@ -103,7 +115,7 @@ class Validator:
             entity_type: Type of entity for error messages
 
         Returns:
-            Point: Django Point object
+            tuple: (longitude, latitude) floats, in Point argument order
 
         Raises:
             ValidationError: If coordinates are invalid
@@ -118,7 +130,7 @@ class Validator:
             if not (-180 <= lon <= 180):
                 raise ValueError(f"Longitude {lon} out of range [-180, 180]")
 
-            return Point(lon, lat)
+            return lon, lat
 
         except (ValueError, TypeError) as e:
             msg = f"Invalid coordinates ({latitude}, {longitude}): {e}"
@@ -126,6 +138,23 @@ class Validator:
                 msg = f"{entity_type}: {msg}"
             raise ValidationError(msg)
 
+    def parse_location(self, latitude, longitude, entity_type=None):
+        """
+        Parse and validate location coordinates
+
+        Args:
+            latitude: Latitude value (string or number)
+            longitude: Longitude value (string or number)
+            entity_type: Type of entity for error messages
+
+        Returns:
+            DeferredPoint: Point built by the database when it is saved
+
+        Raises:
+            ValidationError: If coordinates are invalid
+        """
+        return DeferredPoint(*self.parse_coordinates(latitude, longitude, entity_type))
+
     def lookup_foreign_key(self, index, key, relation_name, entity_type=None):
         """
         Look up foreign key in index with error handling
@@ -167,3 +196,128 @@ class Validator:
         if isinstance(value, str):
             return value.strip() in ("1", "true", "True", "TRUE", "yes", "Yes", "YES")
         return bool(value)
+
+    # Batch validators
+    #
+    # These validate a whole column (e.g., one field of a chunk of rows) at
+    # once. Instead of raising on the first bad value they return a
+    # ColumnResult, so callers can skip rejected rows and log their reasons.
+    # With NumPy installed, and use_numpy left on, a column is converted in a
+    # few array operations; rows are only looked at one by one if the column
+    # has bad values.
+
+    def parse_int_column(self, values, field_name, default=None, entity_type=None, use_numpy=True):
+        """
+        Parse a column of integers
+
+        Args:
+            values: Sequence of values (strings or numbers)
+            field_name: Name of field for error messages
+            default: Value for unparsable entries (None = reject them)
+            entity_type: Type of entity for error messages
+            use_numpy: Use NumPy when it is installed
+
+        Returns:
+            ColumnResult: int64 values (rejected entries hold 0)
+        """
+        return self._parse_column(values, int, "q", field_name, default, entity_type, use_numpy)
+
+    def parse_float_column(self, values, field_name, default=None, entity_type=None, use_numpy=True):
+        """
+        Parse a column of floats
+
+        Args:
+            values: Sequence of values (strings or numbers)
+            field_name: Name of field for error messages
+            default: Value for unparsable entries (None = reject them)
+            entity_type: Type of entity for error messages
+            use_numpy: Use NumPy when it is installed
+
+        Returns:
+            ColumnResult: float64 values (rejected entries hold 0.0)
+        """
+        return self._parse_column(values, float, "d", field_name, default, entity_type, use_numpy)
+
+    def parse_coordinates_columns(self, latitudes, longitudes, entity_type=None, use_numpy=True):
+        """
+        Parse and validate columns of coordinates
+
+        Args:
+            latitudes: Sequence of latitude values
+            longitudes: Sequence of longitude values, parallel to latitudes
+            entity_type: Type of entity for error messages
+            use_numpy: Use NumPy when it is installed
+
+        Returns:
+            tuple: (longitudes, latitudes, rejected, reasons), with the
+            coordinate columns in Point argument order as in
+            parse_coordinates()
+        """
+        if len(latitudes) != len(longitudes):
+            raise ValueError("latitudes and longitudes must have the same length")
+
+        use_numpy = use_numpy and numpy is not None
+        lats = self._parse_column(latitudes, float, "d", "latitude", None, entity_type, use_numpy)
+        lons = self._parse_column(longitudes, float, "d", "longitude", None, entity_type, use_numpy)
+
+        if use_numpy:
+            # NaN fails both comparisons, so it is rejected like in parse_coordinates()
+            out_of_range = ~((lats.values >= -90) & (lats.values <= 90) & (lons.values >= -180) & (lons.values <= 180))
+            rejected = lats.rejected | lons.rejected | out_of_range
+            positions = numpy.flatnonzero(rejected).tolist()
+        else:
+            rejected = [
+                lat_rejected or lon_rejected or not (-90 <= lat <= 90 and -180 <= lon <= 180)
+                for lat, lon, lat_rejected, lon_rejected in zip(lats.values, lons.values, lats.rejected, lons.rejected)
+            ]
+            positions = [position for position, flag in enumerate(rejected) if flag]
+
+        reasons = {}
+        for position in positions:
+            # Reuse the scalar validator for the exact message
+            try:
+                self.parse_coordinates(latitudes[position], longitudes[position], entity_type)
+            except ValidationError as e:
+                reasons[position] = str(e)
+
+        return lons.values, lats.values, rejected, reasons
+
+    def _parse_column(self, values, convert, typecode, field_name, default, entity_type, use_numpy):
+        """Parse a column with convert(), vectorized if possible"""
+        if use_numpy and numpy is not None:
+            dtype = numpy.int64 if typecode == "q" else numpy.float64
+            try:
+                # Strings go through a fixed-width unicode array, which NumPy
+                # parses with the same rules as int() and float()
+                parsed = numpy.asarray(values, dtype=str).astype(dtype)
+                return ColumnResult(parsed, numpy.zeros(len(parsed), dtype=bool), {})
+            except (ValueError, TypeError, OverflowError):
+                # Some value is bad: find which, row by row
+                pass
+
+        parsed = array(typecode)
+        rejected = []
+        reasons = {}
+        for position, value in enumerate(values):
+            try:
+                parsed.append(convert(value))
+                rejected.append(False)
+                continue
+            except (ValueError, TypeError, OverflowError):
+                pass
+
+            if default is not None:
+                parsed.append(default)
+                rejected.append(False)
+                continue
+
+            parsed.append(convert(0))
+            rejected.append(True)
+            msg = f"Invalid {field_name}: {value}"
+            if entity_type:
+                msg = f"{entity_type}: {msg}"
+            reasons[position] = msg
+
+        if use_numpy and numpy is not None:
+            return ColumnResult(numpy.asarray(parsed), numpy.asarray(rejected, dtype=bool), reasons)
+        return ColumnResult(parsed, rejected, reasons)
@@ -1,12 +1,16 @@
 import re
 import unicodedata
+from functools import lru_cache
 from math import acos, cos, radians, sin
 
+from django.contrib.gis.db.models import PointField
+from django.contrib.gis.geos import Point
+from django.db.models import Value
 from django.utils.encoding import force_str as force_text
 from django.utils.functional import keep_lazy
 from django.utils.safestring import SafeText, mark_safe
 
-from .conf import CONTINENT_DATA
+from .conf import CONTINENT_DATA, SLUGIFY_CACHE_SIZE
 
 # GEO DISTANCE
 
@@ -22,6 +26,101 @@ def geo_distance(a, b):
     return acos(cos_x) * earth_radius_km
 
 
+# DEFERRED POINTS
+
+
+@lru_cache(maxsize=None)
+def _point_field(srid):
+    return PointField(srid=srid)
+
+
+class DeferredPoint(Point):
+    """
+    A Point whose geometry is built by the database when it is saved
+
+    Holds the longitude and latitude as floats. Saved, it is written as a
+    point constructor call in the INSERT or UPDATE instead of a WKB
+    parameter, so no GEOS geometry is built for it. Anything using it as a
+    geometry, e.g. a plugin hook, builds the GEOS geometry then.
+    """
+
+    # What the SQL compilers check on expressions
+    contains_aggregate = False
+    contains_over_clause = False
+    contains_column_references = False
+
+    def __init__(self, x, y, srid=4326):
+        self._coordinates = (x, y)
+        self._srid = srid
+
+    def _build(self):
+        if self._ptr is None:
+            Point.__init__(self, *self._coordinates, srid=self._srid)
+
+    def _params(self):
+        # The geometry may have been built and changed since
+        if self._ptr is None:
+            return list(self._coordinates)
+        return [self.x, self.y]
+
+    @property
+    def ptr(self):
+        self._build()
+        return Point.ptr.fget(self)
+
+    @ptr.setter
+    def ptr(self, ptr):
+        Point.ptr.fset(self, ptr)
+
+    @property
+    def srid(self):
+        if self._ptr is None:
+            return self._srid
+        return Point.srid.fget(self)
+
+    @srid.setter
+    def srid(self, srid):
+        if self._ptr is None:
+            self._srid = srid
+        else:
+            Point.srid.fset(self, srid)
+
+    def __len__(self):
+        # Also what truth tests call
+        if self._ptr is None:
+            return len(self._coordinates)
+        return Point.__len__(self)
+
+    def __getattr__(self, name):
+        # The coordinate sequence is set when the geometry is built
+        if name == "_cs" and self._ptr is None:
+            self._build()
+            return self._cs
+        raise AttributeError(name)
+
+    @property
+    def output_field(self):
+        return _point_field(self.srid)
+
+    field = output_field
+
+    def resolve_expression(self, query=None, allow_joins=True, reuse=None, summarize=False, for_save=False):
+        return self
+
+    def get_source_expressions(self):
+        return []
+
+    def as_sql(self, compiler, connection):
+        # Other backends are sent the geometry
+        return Value(self, output_field=self.output_field).as_sql(compiler, connection)
+
+    def as_postgresql(self, compiler, connection):
+        return "ST_SetSRID(ST_MakePoint(%s, %s), {:d})".format(self.srid), self._params()
+
+    def as_sqlite(self, compiler, connection):
+        return "MakePoint(%s, %s, {:d})".format(self.srid), self._params()
+
+
 # ADD CONTINENTS FUNCTION
 
 
@@ -49,20 +148,55 @@ starting_chars_rgx = re.compile(r"^[-._]*", re.UNICODE)
 ending_chars_rgx = re.compile(r"[-._]*$", re.UNICODE)
 
 
+# Runs of dashes and characters slugify_rgx replaces, i.e. slugify_rgx and
+# multi_dash_rgx in one pass
+slug_dash_run_rgx = re.compile(r"[^\w.~]+", re.UNICODE)
+
+
+def slugify_value(value):
+    """
+    Slugify a string
+
+    Gives the same result as applying the regexes above in turn (quote to
+    underscore, disallowed characters to dashes, collapsing dashes, folding
+    dash/underscore pairs, stripping the ends), with fewer passes:
+
+    - ASCII strings are already NFKC normalized, so they skip normalization
+    - Replacing characters and collapsing the dashes they become is one pass
+    - Once dashes are collapsed, both dash/underscore folds need an
+      underscore to match anything, so they are skipped without one
+    - Stripping the ends is str.strip()
+    """
+    value = value.strip()
+    if not value.isascii():
+        value = unicodedata.normalize("NFKC", value)
+    value = slug_dash_run_rgx.sub("-", value.replace("'", "_"))
+    if "_" in value:
+        value = dash_und_rgx.sub("_", value)
+        value = und_dash_rgx.sub("_", value)
+    return value.strip("-._")
+
+
+if SLUGIFY_CACHE_SIZE:
+    slugify_value = lru_cache(maxsize=SLUGIFY_CACHE_SIZE)(slugify_value)
+
+
+def fast_slugify(obj, value):
+    """
+    default_slugify() without the lazy and safe string wrappers
+
+    For code slugifying plain strings in bulk, e.g. importers and model saves.
+    """
+    if value is None:
+        return None
+    return slugify_value(str(value))
+
+
 def default_slugify(obj, value):
     if value is None:
         return None
 
-    value = force_text(str(value))
-    value = unicodedata.normalize("NFKC", value.strip())
-    value = re.sub(to_und_rgx, "_", value)
-    value = re.sub(slugify_rgx, "-", value)
-    value = re.sub(multi_dash_rgx, "-", value)
-    value = re.sub(dash_und_rgx, "_", value)
-    value = re.sub(und_dash_rgx, "_", value)
-    value = re.sub(starting_chars_rgx, "", value)
-    value = re.sub(ending_chars_rgx, "", value)
-    return mark_safe(value)
+    return mark_safe(slugify_value(force_text(str(value))))
 
 
 default_slugify = keep_lazy(str, SafeText)(default_slugify)
@@ -73,6 +207,6 @@ default_slugify = keep_lazy(str, SafeText)(default_slugify)
 
 def patterns(prefix, *args):
     if prefix != "":
-        raise Exception("You need to update your URLConf to be a list of URL " "objects")
+        raise Exception("You need to update your URLConf to be a list of URL objects")
     else:
         return list(args)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from unittest import skipUnless
+
+from django.db import DatabaseError, connection
+from django.test import TestCase
+
+from cities.models import Country, Region
+from cities.services import InitialLoad
+
+
+@skipUnless(connection.vendor == "postgresql", "Indexes are only dropped on PostgreSQL")
+class InitialLoadTestCase(TestCase):
+    def get_constraints(self, model):
+        with connection.cursor() as cursor:
+            return connection.introspection.get_constraints(cursor, model._meta.db_table)
+
+    def test_unique_constraints_kept(self):
+        before = self.get_constraints(Country)
+
+        with InitialLoad([Country]) as initial_load:
+            during = self.get_constraints(Country)
+
+        self.assertEqual(initial_load.tables, [Country._meta.db_table])
+        self.assertEqual(
+            {name for name, e in during.items() if e["unique"]}, {name for name, e in before.items() if e["unique"]}
+        )
+        self.assertFalse([name for name, e in during.items() if e["foreign_key"]])
+        self.assertFalse([name for name, e in during.items() if e["index"] and not e["unique"]])
+        self.assertEqual(self.get_constraints(Country), before)
+
+    def test_tables_with_rows_left_alone(self):
+        Country.objects.create(population=0)
+        before = self.get_constraints(Country)
+
+        with InitialLoad([Country]) as initial_load:
+            self.assertEqual(self.get_constraints(Country), before)
+
+        self.assertEqual(initial_load.tables, [])
+
+    def test_failed_restore_raised_after_the_others(self):
+        before = self.get_constraints(Region)
+
+        with self.assertRaises(DatabaseError):
+            with InitialLoad([Region]):
+                # Violates the foreign key to the country once it is back
+                Region.objects.bulk_create([Region(country_id=999999, name="Nowhere", name_std="Nowhere", code="00")])
+
+        after = self.get_constraints(Region)
+        self.assertEqual(
+            {name: e for name, e in after.items() if not e["foreign_key"]},
+            {name: e for name, e in before.items() if not e["foreign_key"]},
+        )
+        self.assertFalse([name for name, e in after.items() if e["foreign_key"]])
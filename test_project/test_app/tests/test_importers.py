@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.gis.geos import Point
+from django.db import DatabaseError, transaction
+from django.test import SimpleTestCase, TestCase
+
+from cities.conf import settings
+from cities.exceptions import ValidationError
+from cities.importer.city import CityImporter
+from cities.importer.district import DistrictImporter
+from cities.importer.postal_code import ExistingPostalCodes, PostalCodeImporter, RegionNameTables
+from cities.models import City, Country, District, PostalCode, Region, Subregion
+from cities.util import DeferredPoint
+
+
+class ImporterMixin:
+    importer_class = None
+
+    def get_importer(self, **options):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        return self.importer_class(SimpleNamespace(data_dir=data_dir), dict(options, quiet=True))
+
+
+class CitySubregionLookupTestCase(ImporterMixin, SimpleTestCase):
+    importer_class = CityImporter
+
+    def setUp(self):
+        self.importer = self.get_importer()
+        self.importer.region_index = {"UA.01.01": 10}
+        self.importer.subregion_name_index = {
+            "name": {(1, "Bilhorod"): [11], (1, "Okruha"): [12, 13]},
+            "name_std": {(1, "Bilgorod"): [11], (1, "Okruga"): [12, 13]},
+        }
+
+    def test_code_lookup(self):
+        self.assertEqual(self.importer._lookup_subregion("UA", "01", "01", 1, "Town"), 10)
+
+    def test_name_fallback(self):
+        self.assertEqual(self.importer._lookup_subregion("UA", "01", "Bilhorod", 1, "Town"), 11)
+        self.assertEqual(self.importer._lookup_subregion("UA", "01", "Bilgorod (undefined)", 1, "Town"), 11)
+        self.assertIsNone(self.importer._lookup_subregion("UA", "01", "Bilhorod", 2, "Town"))
+
+    def test_ambiguous_name_raises(self):
+        with self.assertRaises(ValidationError):
+            self.importer._lookup_subregion("UA", "01", "Okruha", 1, "Town")
+        with self.assertRaises(ValidationError):
+            self.importer._lookup_subregion("UA", "01", "Okruga", 1, "Town")
+
+
+class FeatureCodeFilterTestCase(ImporterMixin, SimpleTestCase):
+    importer_class = CityImporter
+
+    def test_other_feature_codes_dropped(self):
+        importer = self.get_importer()
+        with mock.patch.object(settings, "plugins", {}, create=True):
+            self.assertTrue(importer.accepts_item({"featureCode": "PPLC"}))
+            self.assertFalse(importer.accepts_item({"featureCode": "PPLX"}))
+
+    def test_other_feature_codes_kept_for_pre_hooks(self):
+        importer = self.get_importer()
+        with mock.patch.object(settings, "plugins", {"city_pre": [object()]}, create=True):
+            self.assertTrue(importer.accepts_item({"featureCode": "PPLX"}))
+        with mock.patch.object(settings, "plugins", {"district_pre": [object()]}, create=True):
+            self.assertFalse(importer.accepts_item({"featureCode": "PPLX"}))
+
+
+class DistrictBatchTestCase(ImporterMixin, TestCase):
+    importer_class = DistrictImporter
+
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(population=0)
+        cls.city = City.objects.create(country=country, location=Point(30.5, 50.4), population=0)
+        cls.other_city = City.objects.create(country=country, location=Point(24.0, 49.8), population=0)
+        District.objects.create(id=100, city=cls.city, name="Podil", location=Point(30.5, 50.5), population=0)
+        District.objects.create(id=200, city=cls.other_city, name="Sykhiv", location=Point(24.0, 49.8), population=0)
+        District.objects.create(id=300, city=cls.city, name="Lypky", location=Point(30.5, 50.4), population=0)
+
+    def setUp(self):
+        self.importer = self.get_importer()
+
+    def parsed(self, geonameid, city, name):
+        return {
+            "id": geonameid,
+            "defaults": {
+                "name": name,
+                "name_std": name,
+                "location": DeferredPoint(30.5, 50.5),
+                "population": 10,
+                "code": "",
+                "city_id": city.id,
+            },
+        }
+
+    def write(self, parsed_batch, batch):
+        """Write rows through one path and return the results and the districts, then roll back"""
+        with transaction.atomic():
+            if batch:
+                results = self.importer.create_or_update_batch(parsed_batch)
+            else:
+                results = [self.importer.create_or_update(parsed) for parsed in parsed_batch]
+            results = [(district.id, created) for district, created in results]
+            districts = sorted(District.objects.values_list("id", "city_id", "name", "slug", "population", "location"))
+            transaction.set_rollback(True)
+        return results, districts
+
+    def test_batch_matches_row_by_row(self):
+        parsed_batch = [
+            # Matches Podil by (city, name), keeps id 100
+            self.parsed(101, self.city, "Podil"),
+            # Matches nothing by (city, name), renames district 200
+            self.parsed(200, self.other_city, "Levandivka"),
+            # Matches Lypky by (city, name) although 200 has the geonameid
+            self.parsed(200, self.city, "Lypky"),
+            # New district
+            self.parsed(400, self.city, "Obolon"),
+        ]
+
+        results, districts = self.write(parsed_batch, batch=True)
+        self.assertEqual(results, [(100, False), (200, False), (300, False), (400, True)])
+        # Locations are built by the database from the coordinates
+        self.assertEqual(districts[-1][-1].coords, (30.5, 50.5))
+        self.assertEqual((results, districts), self.write(parsed_batch, batch=False))
+
+    def test_failed_batch_retried_row_by_row(self):
+        parsed_batch = [self.parsed(101, self.city, "Podil"), self.parsed(400, self.city, "Obolon")]
+        batch = [(parsed, {}) for parsed in parsed_batch]
+
+        with mock.patch.object(self.importer, "create_or_update_batch", side_effect=DatabaseError("deadlock")):
+            with mock.patch.object(self.importer, "create_or_update", wraps=self.importer.create_or_update) as row:
+                self.importer._import_batch(batch)
+
+        self.assertEqual(row.call_count, 2)
+        self.assertEqual(District.objects.get(id=100).population, 10)
+        self.assertEqual(District.objects.get(id=400).name, "Obolon")
+
+
+class PostalCodeLookupTestCase(ImporterMixin, TestCase):
+    importer_class = PostalCodeImporter
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.country = Country.objects.create(code="UA", code3="UKR", population=0)
+        region = Region.objects.create(country=cls.country, name="Kyiv", name_std="Kyiv", code="30")
+        cls.center = PostalCode.objects.create(
+            country=cls.country,
+            region=region,
+            code="01001",
+            name="Kyiv",
+            region_name="Kyiv",
+            location=Point(30.5, 50.45),
+        )
+        cls.podil = PostalCode.objects.create(
+            country=cls.country,
+            region=region,
+            code="01001",
+            name="Podil",
+            region_name="Kyiv",
+            location=Point(30.52, 50.46),
+        )
+
+    def setUp(self):
+        self.importer = self.get_importer()
+        self.importer.existing_postal_codes = ExistingPostalCodes(self.country)
+
+    def find(self, place_name, coordinates):
+        return self.importer._find_existing_postal_code(
+            self.country, "01001", place_name, "kyiv", "30", "", "", "", "", coordinates
+        )
+
+    def test_location_match_takes_precedence(self):
+        self.assertEqual(self.find("Podil", (30.5, 50.45)), self.center)
+        self.assertEqual(self.find("Kyiv", (30.52, 50.46)), self.podil)
+
+    def test_ambiguous_match_raises(self):
+        # Both match by code and names, which is tried before the place name
+        with self.assertRaises(PostalCode.MultipleObjectsReturned):
+            self.find("Podil", (0.0, 0.0))
+
+    def test_saved_postal_codes_are_found(self):
+        pc = PostalCode.objects.create(country=self.country, code="02000", name="Darnytsia", location=Point(30.6, 50.4))
+        self.importer.existing_postal_codes.update(pc, (None, None, None), (30.6, 50.4))
+        found = self.importer._find_existing_postal_code(
+            self.country, "02000", "Darnytsia", "", "", "", "", "", "", (30.6, 50.4)
+        )
+        self.assertEqual(found, pc)
+
+
+class PostalCodeRegionLinkTestCase(ImporterMixin, TestCase):
+    importer_class = PostalCodeImporter
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.country = Country.objects.create(code="UA", code3="UKR", population=0)
+        cls.region = Region.objects.create(country=cls.country, name="Kyiv", name_std="Kyiv", code="30")
+        cls.subregion = Subregion.objects.create(region=cls.region, name="Obolon", name_std="Obolon", code="01")
+        cls.city = City.objects.create(
+            country=cls.country, region=cls.region, location=Point(30.5, 50.45), population=0
+        )
+        cls.district = District.objects.create(
+            city=cls.city, name="Podil", name_std="Podil", location=Point(30.5, 50.46), population=0
+        )
+        # Same district under another name, found through its name_std
+        cls.duplicate = District.objects.create(
+            city=cls.city, name="Podilskyi", name_std="Podil", location=Point(30.5, 50.46), population=0
+        )
+
+        # Same names in another country
+        other_country = Country.objects.create(code="XX", code3="XXX", population=0)
+        other_region = Region.objects.create(country=other_country, name="Kyiv", name_std="Kyiv", code="30")
+        Subregion.objects.create(region=other_region, name="Obolon", name_std="Obolon", code="01")
+        other_city = City.objects.create(
+            country=other_country, region=other_region, location=Point(0.0, 0.0), population=0
+        )
+        District.objects.create(city=other_city, name="Podil", location=Point(0.0, 0.0), population=0)
+
+    def setUp(self):
+        self.importer = self.get_importer()
+
+    def test_names_are_scoped_to_the_country(self):
+        names = RegionNameTables(self.country)
+        self.assertEqual(names.find_region("KYIV"), self.region.id)
+        self.assertEqual(names.find_subregion("kyiv", "obolon"), self.subregion.id)
+        self.assertEqual(names.find_district("Kyiv", "Podil"), (self.district.id, self.city.id, self.duplicate.id))
+
+    def test_districts_of_different_cities_raise(self):
+        other_city = City.objects.create(
+            country=self.country, region=self.region, location=Point(30.6, 50.4), population=0
+        )
+        District.objects.create(city=other_city, name="Podil", location=Point(30.6, 50.4), population=0)
+
+        with self.assertRaises(District.MultipleObjectsReturned):
+            RegionNameTables(self.country).find_district("Kyiv", "Podil")
+
+    def test_duplicate_district_deleted(self):
+        pc, created = self.importer.create_or_update(
+            {
+                "country": self.country,
+                "country_code": "UA",
+                "code": "04070",
+                "place_name": "Kyiv",
+                "region_name": "Kyiv",
+                "region_code": "30",
+                "subregion_name": "Obolon",
+                "subregion_code": "01",
+                "district_name": "Podil",
+                "district_code": "",
+                "location": DeferredPoint(30.5, 50.46),
+                "coordinates": (30.5, 50.46),
+                "item": {},
+            }
+        )
+        self.importer.cleanup()
+
+        self.assertTrue(created)
+        self.assertEqual(
+            (pc.region_id, pc.subregion_id, pc.district_id, pc.city_id),
+            (self.region.id, self.subregion.id, self.district.id, self.city.id),
+        )
+        self.assertTrue(District.objects.filter(id=self.district.id).exists())
+        self.assertFalse(District.objects.filter(id=self.duplicate.id).exists())
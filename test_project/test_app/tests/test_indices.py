@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from array import array
+
+from django.test import SimpleTestCase
+
+from cities.services.compact_index import GeoTypeIndex, SortedIntMap
+from cities.services.disk_index import DiskIndex
+from cities.services.index_builder import IndexBuilder
+from cities.services.index_cache import IndexCache
+from cities.services.spatial_index import NearestPointIndex
+
+
+class SortedIntMapTestCase(SimpleTestCase):
+    def test_from_pairs_last_value_wins(self):
+        index = SortedIntMap.from_pairs([(5, 1), (2, 7), (5, 3), (9, 4)])
+        self.assertEqual(dict(index), {2: 7, 5: 3, 9: 4})
+        self.assertEqual(list(index), [2, 5, 9])
+
+    def test_missing_key(self):
+        index = SortedIntMap.from_pairs([(1, 1)])
+        self.assertNotIn(2, index)
+        self.assertIsNone(index.get(2))
+        with self.assertRaises(KeyError):
+            index[0]
+
+    def test_merge_runs(self):
+        index = SortedIntMap.merge(
+            [(array("q", [1, 4, 6]), 0), (array("q", [2, 4]), 1)],
+            value_typecode="b",
+        )
+        self.assertEqual(dict(index), {1: 0, 2: 1, 4: 1, 6: 0})
+
+
+class GeoTypeIndexTestCase(SimpleTestCase):
+    def test_lookup_returns_type(self):
+        index = GeoTypeIndex(SortedIntMap.from_pairs([(10, 0), (20, 1)]), (str, int))
+        self.assertIs(index[10], str)
+        self.assertIs(index[20], int)
+        self.assertNotIn(30, index)
+
+
+class IndexCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def test_round_trip(self):
+        cache = IndexCache(self.cache_dir)
+        cache.save(
+            "test",
+            [["cities.City", 2, 9]],
+            arrays={"keys": array("q", [3, 9]), "codes": array("b", [1, 2])},
+            data={"a": 1},
+        )
+        arrays, data = cache.load("test", [["cities.City", 2, 9]])
+        self.assertEqual(list(arrays["keys"]), [3, 9])
+        self.assertEqual(list(arrays["codes"]), [1, 2])
+        self.assertEqual(data, {"a": 1})
+
+    def test_stale_fingerprint_misses(self):
+        cache = IndexCache(self.cache_dir)
+        cache.save("test", [["cities.City", 2, 9]], data={})
+        self.assertIsNone(cache.load("test", [["cities.City", 3, 10]]))
+        self.assertIsNone(cache.load("missing", []))
+
+
+class DiskIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.index_dir)
+
+    def test_lookup_matches_dict(self):
+        index = DiskIndex(os.path.join(self.index_dir, "test.sqlite"))
+        self.addCleanup(index.close)
+        index.update([(5, 1), ("UA.01", 7), (5, 3)])
+        self.assertEqual(dict(index.items()), {5: 3, "UA.01": 7})
+        self.assertNotIn("5", index)
+        self.assertIsNone(index.get(6))
+        with self.assertRaises(KeyError):
+            index[6]
+
+    def test_spill_dir_removed_without_data_dir(self):
+        builder = IndexBuilder(quiet=True)
+        index = builder.create_disk_index("test")
+        directory = os.path.dirname(index.filepath)
+        self.assertTrue(os.path.isdir(directory))
+        builder.close()
+        self.assertFalse(os.path.exists(directory))
+
+
+class NearestPointIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        self.index = NearestPointIndex()
+        self.index.add(1, 30.52, 50.45)  # Kyiv
+        self.index.add(2, 24.03, 49.84)  # Lviv
+        self.index.add(3, 179.9, 0.0)
+        self.index.add(4, -179.9, 0.5)
+
+    def test_nearest(self):
+        city_id, distance = self.index.nearest(30.6, 50.4)
+        self.assertEqual(city_id, 1)
+        self.assertLess(distance, 10)
+
+    def test_nearest_across_antimeridian(self):
+        self.assertEqual(self.index.nearest(-179.95, 0.0)[0], 3)
+
+    def test_max_distance(self):
+        self.assertIsNone(self.index.nearest(0.0, 0.0, max_distance_km=1000))
+        self.assertIsNone(NearestPointIndex().nearest(0.0, 0.0))
@@ -1,14 +1,20 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from unittest import skipIf
+import multiprocessing
+from unittest import mock, skipIf, skipUnless
 
 from django import VERSION as django_version
-from django.core.management import call_command
-from django.test import TestCase, override_settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.test.signals import setting_changed
 
+from cities.importer.base import BaseImporter
+from cities.importer.city import CityImporter
+from cities.importer.district import DistrictImporter
 from cities.models import AlternativeName, City, Country, District, PostalCode, Region, Subregion
+from cities.services import Flusher, Maintenance, Parser
 
 from ..mixins import (
     AlternativeNamesMixin,
@@ -131,6 +137,240 @@ class ManageCommandTestCase(
         self.assertEqual(AlternativeName.objects.count(), self.counts["alt_names"])
         self.assertEqual(PostalCode.objects.count(), self.counts["postal_codes"])
 
+    def test_alt_name_reimport_keeps_links(self):
+        through_models = [
+            model._meta.get_field("alt_names").remote_field.through
+            for model in (Country, Region, Subregion, City, District, PostalCode)
+        ]
+        counts = [through.objects.count() for through in through_models]
+
+        call_command(
+            "cities",
+            force=True,
+            **{
+                "import": "alt_name",
+            },
+        )
+
+        self.assertEqual(AlternativeName.objects.count(), self.counts["alt_names"])
+        self.assertEqual([through.objects.count() for through in through_models], counts)
+
+    def test_flush_alt_names(self):
+        num_links = AlternativeName._base_manager.filter(kind="link").count()
+
+        call_command("cities", flush="alt_name")
+
+        self.assertEqual(AlternativeName.objects.count(), 0)
+        self.assertEqual(AlternativeName._base_manager.count(), num_links)
+        self.assertEqual(City.alt_names.through.objects.exclude(alternativename__kind="link").count(), 0)
+
+
+class UkraineImportMixin(object):
+    @classmethod
+    def setUpTestData(cls):
+        # Run the import command only once
+        super(UkraineImportMixin, cls).setUpTestData()
+        call_command(
+            "cities",
+            force=True,
+            countries="UA",
+            **{
+                "import": "country,region,subregion,city",
+            },
+        )
+
+
+class CountriesManageCommandTestCase(UkraineImportMixin, NoInvalidSlugsMixin, TestCase):
+    def test_only_listed_countries_imported(self):
+        self.assertEqual(Country.objects.count(), 1)
+        self.assertEqual(Region.objects.count(), 27)
+        self.assertEqual(Subregion.objects.exclude(region__country__code="UA").count(), 0)
+        self.assertEqual(City.objects.count(), 50)
+
+    def test_flush_is_scoped_to_countries(self):
+        call_command("cities", countries="AD", flush="city")
+        self.assertEqual(City.objects.count(), 50)
+
+        call_command("cities", countries="UA", flush="city")
+        self.assertEqual(City.objects.count(), 0)
+
+
+class MaintenanceTestCase(UkraineImportMixin, TestCase):
+    def test_maintenance(self):
+        timings = Maintenance([City, Region]).run(["cluster", "reindex", "analyze"])
+
+        tasks = [(task, table) for task, table, seconds in timings]
+        self.assertEqual(
+            tasks,
+            [
+                ("cluster", City._meta.db_table),
+                ("analyze", City._meta.db_table),
+                ("reindex", Region._meta.db_table),
+                ("analyze", Region._meta.db_table),
+            ],
+        )
+        self.assertEqual(City.objects.count(), 50)
+
+    def test_maintenance_option(self):
+        with mock.patch.object(Maintenance, "run", autospec=True, side_effect=Maintenance.run) as run:
+            call_command(
+                "cities",
+                countries="UA",
+                maintenance="analyze",
+                **{
+                    "import": "region,city",
+                },
+            )
+
+        maintenance, tasks = run.call_args.args
+        self.assertEqual(tasks, ["analyze"])
+        self.assertEqual(maintenance.models, [Region, City])
+        self.assertEqual(City.objects.count(), 50)
+
+    def test_unknown_maintenance_task(self):
+        with self.assertRaises(CommandError):
+            call_command("cities", maintenance="vacuum", **{"import": "region"})
+
+
+class SharedCityFileTestCase(UkraineImportMixin, TestCase):
+    def test_city_file_read_once(self):
+        with (
+            mock.patch.object(Parser, "get_data", autospec=True, side_effect=Parser.get_data) as get_data,
+            mock.patch.object(BaseImporter, "run", autospec=True, side_effect=BaseImporter.run) as run,
+        ):
+            call_command(
+                "cities",
+                countries="UA",
+                **{
+                    "import": "city,district",
+                },
+            )
+
+        self.assertEqual([call.args[1] for call in get_data.call_args_list].count("city"), 1)
+        # Cities are imported before districts, each from the rows read once
+        self.assertEqual([type(call.args[0]) for call in run.call_args_list], [CityImporter, DistrictImporter])
+        self.assertTrue(all(call.args[1] is not None for call in run.call_args_list))
+        self.assertEqual(City.objects.count(), 50)
+
+
+class FastFlushTestCase(UkraineImportMixin, TestCase):
+    def test_fast_flush(self):
+        call_command("cities", countries="UA", flush="region", flush_strategy="fast")
+        self.assertEqual(Region.objects.count(), 0)
+        self.assertEqual(Subregion.objects.count(), 0)
+        self.assertEqual(City.objects.count(), 50)
+        self.assertEqual(City.objects.filter(region__isnull=False).count(), 0)
+
+
+class RebuildSlugsTestCase(UkraineImportMixin, TestCase):
+    def test_rebuild_slugs(self):
+        expected = dict(City.objects.values_list("id", "slug"))
+        City.objects.update(slug="invalid-SLUG")
+
+        call_command("cities_rebuild_slugs", types="city", only_invalid=True, chunk_size=7, quiet=True)
+
+        self.assertEqual(dict(City.objects.values_list("id", "slug")), expected)
+
+
+@skipUnless(connection.vendor == "postgresql", "TRUNCATE is only used on PostgreSQL")
+class TruncateFlushTestCase(TransactionTestCase):
+    def setUp(self):
+        call_command(
+            "cities",
+            force=True,
+            countries="UA",
+            **{
+                "import": "country,region,subregion,city",
+            },
+        )
+
+    def test_falls_back_when_other_tables_would_be_emptied(self):
+        with mock.patch.object(Flusher, "truncate", autospec=True, side_effect=Flusher.truncate) as truncate:
+            call_command("cities", flush="region", flush_strategy="truncate")
+
+        truncate.assert_not_called()
+        self.assertEqual(Region.objects.count(), 0)
+        self.assertEqual(Subregion.objects.count(), 0)
+        self.assertEqual(City.objects.count(), 50)
+        self.assertEqual(City.objects.filter(region__isnull=False).count(), 0)
+
+    def test_truncates_when_referencing_tables_are_flushed(self):
+        with mock.patch.object(Flusher, "truncate", autospec=True, side_effect=Flusher.truncate) as truncate:
+            call_command("cities", flush="region,subregion,city,district,postal_code", flush_strategy="truncate")
+
+        self.assertEqual(
+            [call.args[1] for call in truncate.call_args_list], [Region, Subregion, City, District, PostalCode]
+        )
+        self.assertEqual(Region.objects.count(), 0)
+        self.assertEqual(City.objects.count(), 0)
+        self.assertEqual(Country.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == "postgresql", "Shadow tables need PostgreSQL")
+class ShadowSwapTestCase(TransactionTestCase):
+    imports = "country,region,subregion,city,alt_name"
+
+    def get_counts(self):
+        models = [Country, Region, Subregion, City, AlternativeName]
+        models += [model._meta.get_field("alt_names").remote_field.through for model in models[:4]]
+        return {model._meta.label: model._base_manager.count() for model in models}
+
+    def get_constraints(self):
+        with connection.cursor() as cursor:
+            return sorted(connection.introspection.get_constraints(cursor, City._meta.db_table))
+
+    def test_reimport_over_existing_data(self):
+        call_command("cities", force=True, countries="UA", **{"import": self.imports})
+        counts = self.get_counts()
+        constraints = self.get_constraints()
+
+        call_command("cities", force=True, countries="UA", shadow_swap=True, **{"import": self.imports})
+
+        self.assertEqual(self.get_counts(), counts)
+        self.assertEqual(self.get_constraints(), constraints)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regnamespace('cities_shadow')")
+            self.assertIsNone(cursor.fetchone()[0])
+
+
+@skipIf("fork" not in multiprocessing.get_all_start_methods(), "Postal code workers need fork()")
+class PostalCodeWorkersTestCase(TransactionTestCase):
+    def get_postal_codes(self):
+        return sorted(
+            PostalCode.objects.values_list(
+                "country__code", "code", "name", "region_id", "subregion_id", "district_id", "city_id"
+            )
+        )
+
+    def test_workers_import_like_serial_import(self):
+        call_command(
+            "cities",
+            force=True,
+            **{
+                "import": "country,region,subregion,city,district",
+            },
+        )
+        call_command(
+            "cities",
+            force=True,
+            postal_code_workers=2,
+            **{
+                "import": "postal_code",
+            },
+        )
+        imported = self.get_postal_codes()
+        self.assertTrue(imported)
+
+        PostalCode.objects.all().delete()
+        call_command(
+            "cities",
+            force=True,
+            **{
+                "import": "postal_code",
+            },
+        )
+        self.assertEqual(self.get_postal_codes(), imported)
+
 
 # This was tested manually
 @skipIf(
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from cities.conf import settings
+from cities.services.parser import Parser
+
+
+class FilteredParserTestCase(SimpleTestCase):
+    languages = ["en", "de", "", "-", "fr_1793", "zh-CN", "link", "ü", "..", "../en", "a/b", "%2E"]
+    line_break = "\n"
+
+    def setUp(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        self.parser = Parser(data_dir)
+
+        fields = settings.files["alt_name"]["fields"]
+        lines = ["# comment\n"]
+        for position in range(500):
+            row = {field: str(position) for field in fields}
+            row["language"] = self.languages[position % len(self.languages)]
+            row["name"] = "nàme {}".format(position)
+            lines.append("\t".join(row[field] for field in fields) + self.line_break)
+        # The last line has no line break
+        lines[-1] = lines[-1].rstrip(self.line_break)
+
+        filename = self.parser.get_filenames("alt_name")[0]
+        filepath = self.parser.get_filepath("alt_name", filename)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with zipfile.ZipFile(filepath, "w") as zf:
+            zf.writestr(filename.rsplit(".", 1)[0] + ".txt", "".join(lines))
+
+        self.rows = list(self.parser.get_data("alt_name"))
+
+    def expected(self, values):
+        return [row for row in self.rows if row["language"] in values]
+
+    def test_filtered_rows_match_unfiltered(self):
+        for values in ({"en"}, {"en", ""}, {"ü", "de"}, set()):
+            rows = list(self.parser.get_data("alt_name", field="language", values=values))
+            self.assertEqual(rows, self.expected(values))
+
+    @mock.patch("cities.services.parser.SEGMENT_BUFFER_SIZE", 100)
+    def test_segmented_rows_match_unfiltered(self):
+        for values in ({"en"}, {"en", ""}, {"ü", "de"}, set()):
+            rows = list(self.parser.get_segmented_data("alt_name", "language", values))
+            # Segments are read one value after another
+            rows.sort(key=lambda row: int(row["nameid"]))
+            self.assertEqual(rows, self.expected(values))
+
+    def test_segments_stay_in_their_directory(self):
+        list(self.parser.get_segmented_data("alt_name", "language", set(self.languages)))
+        segments_root = os.path.join(self.parser.data_dir, "segments", "alt_name", "language")
+        (segment_dir,) = os.listdir(segments_root)
+        segments = os.listdir(os.path.join(segments_root, segment_dir))
+        self.assertEqual(len(segments), len(self.languages))
+
+
+class CRLFParserTestCase(FilteredParserTestCase):
+    line_break = "\r\n"
+
+    def test_last_column_has_no_carriage_return(self):
+        for row in self.parser.get_data("alt_name", field="language", values={"en"}):
+            self.assertEqual(row["isHistoric"], row["nameid"])
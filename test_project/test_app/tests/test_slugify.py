@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import random
+import re
+import unicodedata
+
+from django.test import SimpleTestCase
+
+from cities import util
+
+
+def reference_slugify(value):
+    """The original regex-by-regex default_slugify(), without the wrappers"""
+    value = unicodedata.normalize("NFKC", str(value).strip())
+    value = re.sub(util.to_und_rgx, "_", value)
+    value = re.sub(util.slugify_rgx, "-", value)
+    value = re.sub(util.multi_dash_rgx, "-", value)
+    value = re.sub(util.dash_und_rgx, "_", value)
+    value = re.sub(util.und_dash_rgx, "_", value)
+    value = re.sub(util.starting_chars_rgx, "", value)
+    value = re.sub(util.ending_chars_rgx, "", value)
+    return value
+
+
+class SlugifyTestCase(SimpleTestCase):
+    names = [
+        "",
+        "Kyiv",
+        "Saint-Jean-d'Angély",
+        "São Paulo (undefined)",
+        "  -_Ḩalab_- ",
+        "New  York -- City_ _x",
+        "ﬁve ① ǅ",
+        "a'-_'b",
+    ]
+
+    def test_matches_reference(self):
+        rnd = random.Random(0)
+        alphabet = list("-_.~' \t/()aZ9é,") + ["ﬁ", "ǅ", "①", "́", "中"]
+        names = self.names + ["".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 12))) for _ in range(5000)]
+
+        for name in names:
+            expected = reference_slugify(name)
+            self.assertEqual(util.fast_slugify(None, name), expected, repr(name))
+            self.assertEqual(util.default_slugify(None, name), expected, repr(name))
+
+    def test_none(self):
+        self.assertIsNone(util.fast_slugify(None, None))
+        self.assertIsNone(util.default_slugify(None, None))
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from django.test import SimpleTestCase
+
+from cities.services.validator import Validator
+
+
+class ColumnValidatorTestCase(SimpleTestCase):
+    def setUp(self):
+        self.validator = Validator()
+
+    def test_int_column_rejects_bad_values(self):
+        for use_numpy in (True, False):
+            result = self.validator.parse_int_column(
+                ["1", "x", "3"], "population", entity_type="City", use_numpy=use_numpy
+            )
+            self.assertEqual(list(result.rejected), [False, True, False])
+            self.assertEqual(int(result.values[2]), 3)
+            self.assertEqual(result.reasons, {1: "City: Invalid population: x"})
+
+    def test_int_column_default(self):
+        result = self.validator.parse_int_column(["1", ""], "population", default=0)
+        self.assertEqual([int(e) for e in result.values], [1, 0])
+        self.assertFalse(any(result.rejected))
+
+    def test_coordinates_columns_range_check(self):
+        for use_numpy in (True, False):
+            lons, lats, rejected, reasons = self.validator.parse_coordinates_columns(
+                ["50.5", "95", "nan"], ["30.5", "0", "0"], use_numpy=use_numpy
+            )
+            self.assertEqual(list(rejected), [False, True, True])
+            self.assertEqual((float(lons[0]), float(lats[0])), (30.5, 50.5))
+            self.assertEqual(sorted(reasons), [1, 2])
+
+    def test_location_built_on_use(self):
+        location = self.validator.parse_location("50.5", "30.5")
+        self.assertEqual((location.x, location.y, location.srid), (30.5, 50.5, 4326))